@@ -0,0 +1,251 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from config import Config
+
+# Highest priority first
+PRIORITIES = ("interactive", "batch")
+
+# Tokens spent on the instruction template and system prompt regardless of input size
+PROMPT_OVERHEAD_TOKENS = 600
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of queued"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"{reason} (retry after {retry_after:.0f}s)")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Token-budget admission control with per-client fair-share priority queues.
+
+    Each request reserves its estimated token cost from a token bucket that
+    refills at the upstream tokens-per-minute limit. Waiting requests are
+    served highest priority first and round-robin across clients within a
+    priority, so a single client cannot starve others. Requests that could
+    not start within ``max_wait`` are rejected up front with a retry-after.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = None,
+        max_queue_depth: int = None,
+        max_queue_per_client: int = None,
+        tokens_per_minute: int = None,
+        max_wait: float = None,
+    ):
+        self.max_concurrent = max_concurrent or Config.MAX_CONCURRENT_REQUESTS
+        self.max_queue_depth = max_queue_depth or Config.MAX_QUEUE_DEPTH
+        self.max_queue_per_client = (
+            max_queue_per_client or Config.MAX_QUEUE_PER_CLIENT
+        )
+        self.capacity = float(tokens_per_minute or Config.UPSTREAM_TOKENS_PER_MINUTE)
+        self.max_wait = max_wait if max_wait is not None else Config.MAX_QUEUE_WAIT
+        self.refill_rate = self.capacity / 60.0
+
+        self._cond = threading.Condition()
+        self._budget = self.capacity
+        self._last_refill = time.monotonic()
+        self._running = 0
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._queued_tokens = 0
+        self._ids = itertools.count(1)
+        self._counters = {
+            "admitted": 0,
+            "completed": 0,
+            "shed_queue_full": 0,
+            "shed_client_limit": 0,
+            "shed_budget": 0,
+            "shed_timeout": 0,
+        }
+
+    def estimate_tokens(self, code_length: int, traceback_length: int = 0) -> int:
+        """Rough upstream cost of one analysis (about 4 characters per token)"""
+        prompt_tokens = (code_length + traceback_length) // 4 + PROMPT_OVERHEAD_TOKENS
+        return prompt_tokens + Config.MAX_TOKENS
+
+    def acquire(
+        self,
+        client_id: str,
+        estimated_tokens: int,
+        priority: str = "interactive",
+        timeout: float = None,
+    ) -> dict:
+        """Block until the request may call upstream, or raise AdmissionRejected.
+
+        ``timeout`` shortens the maximum wait, e.g. to fit a request deadline.
+        """
+        max_wait = self.max_wait if timeout is None else min(self.max_wait, timeout)
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority: {priority}")
+
+        # A single request larger than the whole bucket still has to be able to run
+        cost = min(float(estimated_tokens), self.capacity)
+        ticket = {
+            "id": next(self._ids),
+            "client_id": client_id,
+            "priority": priority,
+            "cost": cost,
+            "enqueued_at": time.monotonic(),
+        }
+
+        with self._cond:
+            self._refill()
+            self._check_admissible(ticket, max_wait)
+            self._enqueue(ticket)
+
+            deadline = ticket["enqueued_at"] + max_wait
+            while True:
+                self._refill()
+                if self._next_ticket() is ticket and self._can_start(ticket):
+                    self._start(ticket)
+                    return ticket
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._dequeue(ticket)
+                    self._counters["shed_timeout"] += 1
+                    self._cond.notify_all()
+                    raise AdmissionRejected(
+                        "Timed out waiting for capacity", self._estimated_wait(cost)
+                    )
+
+                timeout = remaining
+                if self._budget < cost:
+                    timeout = min(timeout, (cost - self._budget) / self.refill_rate)
+                self._cond.wait(timeout=max(timeout, 0.01))
+
+    def release(self, ticket: dict, actual_tokens: int = None):
+        """Free the slot and refund any over-reserved tokens"""
+        with self._cond:
+            self._running -= 1
+            self._counters["completed"] += 1
+            if actual_tokens is not None and actual_tokens < ticket["cost"]:
+                self._budget = min(
+                    self.capacity, self._budget + ticket["cost"] - actual_tokens
+                )
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(
+        self,
+        client_id: str,
+        estimated_tokens: int,
+        priority: str = "interactive",
+        timeout: float = None,
+    ):
+        """Context manager around acquire/release.
+
+        The yielded ticket has a ``used_tokens`` key that callers may set to
+        the actual usage reported upstream so that the difference is refunded.
+        """
+        ticket = self.acquire(client_id, estimated_tokens, priority, timeout)
+        ticket["used_tokens"] = None
+        try:
+            yield ticket
+        finally:
+            self.release(ticket, ticket["used_tokens"])
+
+    def stats(self) -> dict:
+        """Queue depth, budget and shed counters for monitoring"""
+        with self._cond:
+            self._refill()
+            depth = {
+                priority: sum(len(q) for q in queues.values())
+                for priority, queues in self._queues.items()
+            }
+            return {
+                "running": self._running,
+                "queue_depth": depth,
+                "queued_clients": {
+                    priority: len(queues) for priority, queues in self._queues.items()
+                },
+                "queued_tokens": int(self._queued_tokens),
+                "token_budget": int(self._budget),
+                "token_capacity": int(self.capacity),
+                "shed_total": sum(
+                    v for k, v in self._counters.items() if k.startswith("shed_")
+                ),
+                **self._counters,
+            }
+
+    # Internal helpers; all expect self._cond to be held
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._budget = min(self.capacity, self._budget + elapsed * self.refill_rate)
+
+    def _queue_depth(self) -> int:
+        return sum(len(q) for queues in self._queues.values() for q in queues.values())
+
+    def _estimated_wait(self, cost: float) -> float:
+        """Seconds until the bucket could cover everything queued plus `cost`"""
+        deficit = self._queued_tokens + cost - self._budget
+        return max(1.0, deficit / self.refill_rate)
+
+    def _check_admissible(self, ticket: dict, max_wait: float):
+        depth = self._queue_depth()
+        cost = ticket["cost"]
+
+        # Batch work only gets the first half of the queue so interactive
+        # users always have room
+        depth_limit = self.max_queue_depth
+        if ticket["priority"] != "interactive":
+            depth_limit = max(1, self.max_queue_depth // 2)
+        if depth >= depth_limit:
+            self._counters["shed_queue_full"] += 1
+            raise AdmissionRejected("Server queue is full", self._estimated_wait(cost))
+
+        client_queue = self._queues[ticket["priority"]].get(ticket["client_id"])
+        if client_queue is not None and len(client_queue) >= self.max_queue_per_client:
+            self._counters["shed_client_limit"] += 1
+            raise AdmissionRejected(
+                "Too many pending requests from this client",
+                self._estimated_wait(cost),
+            )
+
+        wait = self._estimated_wait(cost) if self._queued_tokens + cost > self._budget else 0
+        if wait > max_wait:
+            self._counters["shed_budget"] += 1
+            raise AdmissionRejected("Upstream token budget exhausted", wait)
+
+    def _enqueue(self, ticket: dict):
+        queues = self._queues[ticket["priority"]]
+        queues.setdefault(ticket["client_id"], deque()).append(ticket)
+        self._queued_tokens += ticket["cost"]
+
+    def _dequeue(self, ticket: dict):
+        queues = self._queues[ticket["priority"]]
+        client_queue = queues[ticket["client_id"]]
+        client_queue.remove(ticket)
+        if not client_queue:
+            del queues[ticket["client_id"]]
+        self._queued_tokens -= ticket["cost"]
+
+    def _next_ticket(self) -> dict:
+        for priority in PRIORITIES:
+            queues = self._queues[priority]
+            if queues:
+                return queues[next(iter(queues))][0]
+        return None
+
+    def _can_start(self, ticket: dict) -> bool:
+        return self._running < self.max_concurrent and self._budget >= ticket["cost"]
+
+    def _start(self, ticket: dict):
+        queues = self._queues[ticket["priority"]]
+        self._dequeue(ticket)
+        # Round-robin: a served client goes to the back of its priority class
+        if ticket["client_id"] in queues:
+            queues.move_to_end(ticket["client_id"])
+        self._budget -= ticket["cost"]
+        self._running += 1
+        self._counters["admitted"] += 1
+        self._cond.notify_all()
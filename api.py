@@ -0,0 +1,182 @@
+import itertools
+import json
+import math
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from config import Config
+
+
+class AnalyzeItem(BaseModel):
+    code: str
+    traceback: str = ""
+    performance_mode: bool = False
+    output_mode: Optional[str] = None
+    session_id: Optional[str] = None
+
+
+class AnalyzeRequest(BaseModel):
+    """Either a single item (code, traceback) or a batch in `items`"""
+
+    code: Optional[str] = None
+    traceback: str = ""
+    performance_mode: bool = False
+    output_mode: Optional[str] = None
+    session_id: Optional[str] = None
+    items: Optional[List[AnalyzeItem]] = None
+
+
+def build_api_router(run_pipeline, status, create_session) -> APIRouter:
+    """JSON API next to the Gradio UI.
+
+    ``run_pipeline(code, traceback, client_id, performance_mode=..., priority=...)``
+    returns the structured result dict; ``status()`` returns server metrics
+    and ``create_session()`` issues a new session id. Items that carry a
+    ``session_id`` from ``POST /sessions`` continue that follow-up session
+    and can reuse past analyses recorded under it; other ids are rejected.
+    Single requests run as interactive work, batch items as batch work so
+    that the admission controller sheds them first.
+    """
+    router = APIRouter(prefix="/api/v1")
+
+    def analyze_one(item: AnalyzeItem, client_id: str, priority: str) -> dict:
+        """Result dict with an HTTP-style ``status``: 200, 400, 429 or 500"""
+        try:
+            result = run_pipeline(
+                item.code,
+                item.traceback,
+                client_id,
+                performance_mode=item.performance_mode,
+                priority=priority,
+                output_mode=item.output_mode,
+                session_id=item.session_id,
+                owner_id=item.session_id,
+            )
+        except ValueError as e:
+            return {"status": 400, "error": str(e)}
+        except Exception as e:
+            if Config.DEBUG_MODE:
+                print(f"Debug: API analysis failed: {e}")
+            return {"status": 500, "error": "Internal error during analysis"}
+
+        degraded = result.get("degraded") or {}
+        if degraded.get("retry_after") is not None:
+            # Shed by admission control: the client should back off and retry
+            return {
+                "status": 429,
+                "error": degraded["reason"],
+                "retry_after": degraded["retry_after"],
+                **result,
+            }
+        return {"status": 200, **result}
+
+    def retry_headers(retry_after) -> dict:
+        if retry_after is None:
+            return {}
+        return {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+    def iter_batch(items: list, client_id: str):
+        """Yield (index, result) as each batch item completes.
+
+        Items are started as earlier ones finish, at most
+        ``API_BATCH_CONCURRENCY`` at a time, so once the consumer stops
+        (e.g. an NDJSON client disconnects) no further LLM calls are made.
+        """
+        workers = max(1, min(Config.API_BATCH_CONCURRENCY, len(items)))
+        pending = enumerate(items)
+        pool = ThreadPoolExecutor(max_workers=workers)
+        running = {}
+
+        def start(count: int):
+            for index, item in itertools.islice(pending, count):
+                running[pool.submit(analyze_one, item, client_id, "batch")] = index
+
+        try:
+            start(workers)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                start(len(done))
+                for future in done:
+                    yield running.pop(future), future.result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def check_batch(body: AnalyzeRequest) -> list:
+        items = body.items
+        if items is None:
+            if body.code is None:
+                raise HTTPException(400, "Provide `code` and `traceback`, or `items`")
+            items = [
+                AnalyzeItem(
+                    code=body.code,
+                    traceback=body.traceback,
+                    performance_mode=body.performance_mode,
+                    output_mode=body.output_mode,
+                    session_id=body.session_id,
+                )
+            ]
+        if not items:
+            raise HTTPException(400, "`items` must not be empty")
+        if len(items) > Config.API_MAX_BATCH_ITEMS:
+            raise HTTPException(
+                413, f"At most {Config.API_MAX_BATCH_ITEMS} items per batch"
+            )
+        return items
+
+    @router.post("/analyze")
+    def analyze(body: AnalyzeRequest, request: Request):
+        """Analyze one item, or a batch returned in input order.
+
+        A single item answers 429 with Retry-After when it was shed and 500
+        on internal errors. A batch answers 200 with a ``status`` per item,
+        or 429 if every item was shed.
+        """
+        client_id = request.client.host if request.client else "anonymous"
+        if body.items is None:
+            item = check_batch(body)[0]
+            result = analyze_one(item, client_id, "interactive")
+            status_code = result.pop("status")
+            if status_code != 200:
+                raise HTTPException(
+                    status_code,
+                    result["error"],
+                    headers=retry_headers(result.get("retry_after")),
+                )
+            return result
+
+        results = [None] * len(body.items)
+        for index, result in iter_batch(check_batch(body), client_id):
+            results[index] = result
+        if all(result["status"] == 429 for result in results):
+            raise HTTPException(
+                429,
+                "Server busy: every item was shed",
+                headers=retry_headers(max(result["retry_after"] for result in results)),
+            )
+        return {"results": results}
+
+    @router.post("/analyze/stream")
+    def analyze_stream(body: AnalyzeRequest, request: Request):
+        """Analyze a batch, streaming one NDJSON line per item as it completes"""
+        client_id = request.client.host if request.client else "anonymous"
+        items = check_batch(body)
+
+        def lines():
+            for index, result in iter_batch(items, client_id):
+                yield json.dumps({"index": index, **result}, default=str) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @router.post("/sessions")
+    def new_session():
+        """Start a follow-up session; pass its id as ``session_id``"""
+        return {"session_id": create_session()}
+
+    @router.get("/status")
+    def server_status():
+        return status()
+
+    return router
@@ -2,9 +2,15 @@ import gradio as gr
 import time
 import os
 from config import Config
+from admission import AdmissionController, AdmissionRejected
+from deadline import Deadline
 from error_parser import ErrorParser
 from groq_handler import GroqBugFixer
-from utils.formatters import OutputFormatter
+from history_store import AnalysisHistory, error_signature
+from ingestion import final_traceback, read_code_file, read_traceback_file
+from profiler import SandboxProfiler
+from session import SessionStore
+from utils.formatters import PARSE_METRICS, OutputFormatter
 
 # Validate configuration on startup
 try:
@@ -18,40 +24,419 @@ except Exception as e:
 error_parser = ErrorParser()
 groq_fixer = GroqBugFixer()
 formatter = OutputFormatter()
+history = AnalysisHistory() if Config.ENABLE_HISTORY else None
+admission = AdmissionController()
+profiler = SandboxProfiler()
+sessions = SessionStore()
 
 
-def analyze_code(code, error_traceback):
-    """Main function to analyze code and generate fixes"""
+def client_id_for(request) -> str:
+    """Identify the caller for fair-share queueing.
+
+    The browser session comes first, so that users behind one NAT or proxy
+    do not share MAX_QUEUE_PER_CLIENT; the client host is the fallback.
+    """
+    if request is None:
+        return "anonymous"
+    if request.session_hash:
+        return request.session_hash
+    if request.client is not None and request.client.host:
+        return request.client.host
+    return "anonymous"
+
+
+def owner_id_for(request) -> str:
+    """Owner token of stored analyses, unique per browser session; None
+    without one (the fair-share id may fall back to the shared client host)"""
+    if request is None or not request.session_hash:
+        return None
+    return request.session_hash
+
+
+def degraded_sections(analysis: dict, run: dict, owner_id: str) -> tuple:
+    """Best available answer when the LLM did not finish: streamed sections,
+    then a similar past analysis of the same owner, then a local explanation"""
+    sections = error_parser.explain_locally(analysis)
+    sources = ["a local analysis of the traceback"]
+
+    if history is not None and owner_id is not None:
+        similar = history.find_by_signature(
+            error_signature(analysis["error_details"]), limit=1, owner_id=owner_id
+        )
+        record = history.get(similar[0]["id"], owner_id) if similar else None
+        # Diff sections from a patch-mode answer do not fit a text answer
+        if record and record.get("output_mode") == analysis["output_mode"]:
+            sections.update(
+                {key: value for key, value in record["sections"].items() if value}
+            )
+            sources.insert(0, "a past analysis of a similar error")
+
+    if run is not None and run["partial_sections"]:
+        sections.update(run["partial_sections"])
+        sources.insert(0, "the partially received AI answer")
+
+    return sections, sources
+
+
+def analysis_steps(
+    code,
+    error_traceback,
+    client_id="anonymous",
+    performance_mode=False,
+    priority="interactive",
+    output_mode=None,
+    session_id=None,
+    sandbox_validation=True,
+    owner_id=None,
+):
+    """Analysis pipeline shared by the Gradio UI and the JSON API.
+
+    Yields ("status", message, ui_delay) progress events and ("result", result)
+    events; the last result is final. Raises ValueError for invalid input.
+    With a ``session_id`` issued by ``sessions.create`` resubmissions of
+    edited code are sent as follow-up turns of that session's earlier
+    conversation; unknown or expired ids are rejected. ``sandbox_validation=False``
+    keeps patched code from being run, e.g. for trimmed uploads. Past
+    analyses are only reused for, and recorded under, ``owner_id``; without
+    one nothing is looked up in the history.
+    """
     if not code or not code.strip():
-        return "❌ Please provide Python code to analyze."
+        raise ValueError("Please provide Python code to analyze.")
+
+    if performance_mode and not Config.ENABLE_PERFORMANCE_MODE:
+        raise ValueError(
+            "Performance mode is disabled on this server "
+            "(set ENABLE_PERFORMANCE_MODE=true to enable it)."
+        )
+
+    if performance_mode and (not error_traceback or not error_traceback.strip()):
+        error_traceback = "No exception was raised: the code is too slow or times out."
 
     if not error_traceback or not error_traceback.strip():
-        return "❌ Please provide the error traceback."
+        raise ValueError("Please provide the error traceback.")
+
+    # Keep only the final exception chain of a pasted multi-megabyte log
+    if len(error_traceback) > Config.MAX_TRACEBACK_CHARS:
+        error_traceback = final_traceback(error_traceback)
+
+    output_mode = output_mode or Config.OUTPUT_MODE
+    if output_mode not in ("text", "patch", "json"):
+        raise ValueError(f"Unknown output mode: {output_mode}")
+
+    session = sessions.get(session_id) if session_id else None
+    if session_id and session is None:
+        raise ValueError(
+            "Unknown or expired session_id; start a new session and resubmit."
+        )
+    deadline = Deadline(Config.REQUEST_DEADLINE_SECONDS)
+    llm_deadline = deadline.sooner_by(Config.DEADLINE_RESERVE_SECONDS)
+
+    yield "status", "Analyzing your code and error... Please wait.", 1
+
+    # Reopen an identical earlier analysis instead of calling the LLM again
+    if (
+        history is not None
+        and owner_id is not None
+        and not performance_mode
+        and output_mode == "text"
+    ):
+        previous = history.find_exact(
+            code, error_traceback, output_mode, performance_mode, owner_id
+        )
+        if previous is not None:
+            result = new_result(
+                error_parser.chunk_processor.extract_error_details(error_traceback),
+                previous["sections"],
+            )
+            result["from_history"] = previous["id"]
+            result["model"] = previous["model"]
+            yield "result", result
+            return
+
+    # Step 1: Parse and analyse error
+    analysis = error_parser.analyze_error(code, error_traceback)
+    analysis["output_mode"] = output_mode
+    analysis["performance_mode"] = bool(performance_mode)
+    analysis["sandbox_validation"] = sandbox_validation
+
+    baseline_profile = None
+    if performance_mode:
+        yield "status", "Profiling your code in the sandbox...", 0
+        # Leave most of the deadline for the LLM call
+        baseline_profile = profiler.profile(
+            code,
+            max(0.5, min(profiler.time_budget, llm_deadline.remaining() / 4)),
+        )
+        analysis["profile_summary"] = profiler.summarize(code, baseline_profile)
+
+    yield "status", "Generating three different solutions...", 0.5
 
+    # Step 2: Generate fixes using Groq, once admitted under the upstream budget
+    estimated_tokens = admission.estimate_tokens(
+        analysis["code_length"], len(error_traceback)
+    )
+    # One turn at a time per session, checked before it takes an admission slot
+    if session is not None and not session.lock.acquire(blocking=False):
+        raise ValueError(
+            "An analysis in this session is still running; wait for it to finish."
+        )
+    rejected = None
     try:
-        # Show loading state
-        yield "Analyzing your code and error... Please wait."
-        time.sleep(1)
+        with admission.admit(
+            client_id,
+            estimated_tokens,
+            priority,
+            timeout=llm_deadline.remaining(),
+        ) as ticket:
+            run = groq_fixer.run_analysis(
+                code, error_traceback, analysis, deadline=llm_deadline, session=session
+            )
+            if run["prompt_tokens"] is not None:
+                ticket["used_tokens"] = run["prompt_tokens"] + (
+                    run["completion_tokens"] or 0
+                )
+    except AdmissionRejected as e:
+        rejected = e
+    finally:
+        if session is not None:
+            session.lock.release()
+
+    if rejected is not None:
+        sections, sources = degraded_sections(analysis, None, owner_id)
+        result = new_result(analysis["error_details"], sections)
+        result["degraded"] = {
+            "reason": f"the server is busy ({rejected.reason}); retry in about {rejected.retry_after:.0f} seconds",
+            "sources": sources,
+            "retry_after": rejected.retry_after,
+        }
+        yield "result", result
+        return
+
+    result = new_result(analysis["error_details"], run["sections"], run)
+
+    if run["timed_out"] or not run["success"]:
+        if run["timed_out"]:
+            reason = f"the AI did not finish within {Config.REQUEST_DEADLINE_SECONDS:.0f} seconds"
+        else:
+            reason = f"the AI service failed ({run['error']})"
+        result["sections"], sources = degraded_sections(analysis, run, owner_id)
+        result["degraded"] = {"reason": reason, "sources": sources}
+        yield "result", result
+        return
+
+    if history is not None:
+        history.record(code, error_traceback, analysis, run, owner_id)
+
+    # Step 3: Measure each solution against the original profile
+    if baseline_profile is not None:
+        yield "result", result
+        yield "status", "⏱️ Measuring each solution in the sandbox...", 0
+        candidates = {}
+        for key in ("solution1", "solution2", "solution3"):
+            patch = (result["patches"] or {}).get(key)
+            if patch and patch["patched_code"]:
+                blocks = [patch["patched_code"]]
+            else:
+                blocks = formatter.extract_code_blocks(result["sections"][key])
+            # Measurements are optional; stop once the deadline is spent
+            if blocks and not deadline.expired():
+                candidates[key] = profiler.measure_speedup(
+                    baseline_profile,
+                    max(blocks, key=len),
+                    max(0.5, min(profiler.time_budget, deadline.remaining())),
+                )
+        result["performance"] = {"baseline": baseline_profile, "solutions": candidates}
+
+    yield "result", result
+
+
+def new_result(error_details: dict, sections: dict, run: dict = None) -> dict:
+    """Structured analysis result, as returned by the JSON API"""
+    run = run or {}
+    return {
+        "error_details": error_details,
+        "sections": sections,
+        "degraded": None,
+        "from_history": None,
+        "performance": None,
+        "model": run.get("model"),
+        "latency": run.get("latency"),
+        "prompt_tokens": run.get("prompt_tokens"),
+        "completion_tokens": run.get("completion_tokens"),
+        "patches": run.get("patches"),
+        "patch_stats": run.get("patch_stats"),
+        "session": run.get("session"),
+    }
 
-        # Step 1: Parse and analyse error
-        analysis = error_parser.analyze_error(code, error_traceback)
 
-        yield f"Generating three different solutions..."
-        time.sleep(0.5)
+def run_pipeline(code, error_traceback, client_id="anonymous", **options) -> dict:
+    """Run the analysis pipeline to completion and return the final result"""
+    result = None
+    for event in analysis_steps(code, error_traceback, client_id, **options):
+        if event[0] == "result":
+            result = event[1]
+    return result
 
-        # Step 2: Generate fixes using Groq
-        result = groq_fixer.generate_fixes(code, error_traceback, analysis)
 
-        # Step 3: Format final output
-        final_output = formatter.format_final_output(result)
+def render_result(result: dict) -> str:
+    """Markdown for the Gradio output panel"""
+    output = ""
+    if result["degraded"]:
+        output += formatter.format_degraded_notice(
+            result["degraded"]["reason"], result["degraded"]["sources"]
+        )
+    sections = dict(result["sections"])
+    for key, patch in (result["patches"] or {}).items():
+        sections[key] += formatter.format_patch_result(patch)
+    output += formatter.format_final_output(sections)
+    if result["patch_stats"]:
+        output += formatter.format_patch_stats(result["patch_stats"])
+    if result["performance"]:
+        output += formatter.format_performance_report(
+            result["performance"]["baseline"], result["performance"]["solutions"]
+        )
+    if result["session"]:
+        output += formatter.format_session_stats(result["session"])
+    return output
+
 
-        yield final_output
+def load_uploads(code, error_traceback, code_file=None, log_file=None) -> tuple:
+    """Replace the pasted inputs with uploaded files, read in bounded memory.
 
+    Returns (code, error_traceback, note, trimmed); the note explains any
+    trimming, and trimmed code cannot be run as a whole.
+    """
+    note = ""
+    trimmed = False
+    if log_file:
+        error_traceback = read_traceback_file(log_file)
+        if not error_traceback:
+            raise ValueError("The uploaded log file is empty.")
+    if code_file:
+        loaded = read_code_file(code_file, error_traceback or "")
+        code, error_traceback, note, trimmed = (
+            loaded["code"],
+            loaded["traceback"] or error_traceback,
+            loaded["note"],
+            loaded["trimmed"],
+        )
+    return code, error_traceback, note, trimmed
+
+
+def analyze_code(
+    code,
+    error_traceback,
+    performance_mode=False,
+    output_mode="text",
+    follow_up=False,
+    code_file=None,
+    log_file=None,
+    request: gr.Request = None,
+):
+    """Main function to analyze code and generate fixes"""
+    rendered = ""
+    try:
+        code, error_traceback, note, trimmed = load_uploads(
+            code, error_traceback, code_file, log_file
+        )
+        if trimmed:
+            # Omitted lines make the fragment fail or behave differently if run
+            note += (
+                " Performance mode and sandbox validation of patches are off "
+                "because the trimmed code cannot run on its own."
+            )
+            performance_mode = False
+        if note:
+            note = f"📎 {note}\n\n"
+        for event in analysis_steps(
+            code,
+            error_traceback,
+            client_id_for(request),
+            performance_mode,
+            output_mode=output_mode,
+            session_id=(
+                sessions.create(ui_session_id(request)) if follow_up else None
+            ),
+            sandbox_validation=not trimmed,
+            owner_id=owner_id_for(request),
+        ):
+            if event[0] == "status":
+                _, message, ui_delay = event
+                yield f"{rendered}\n{message}" if rendered else message
+                time.sleep(ui_delay)
+            else:
+                rendered = note + render_result(event[1])
+                yield rendered
+
+    except ValueError as e:
+        yield f"❌ {e}"
     except Exception as e:
         error_message = f"❌ An error occurred during analysis:\n{str(e)}"
         yield error_message
 
 
+def ui_session_id(request) -> tuple:
+    """One follow-up session per browser tab, or None without a session hash.
+
+    A tuple, so that no session id sent to the JSON API (always a string)
+    can address it.
+    """
+    owner_id = owner_id_for(request)
+    return ("ui", owner_id) if owner_id else None
+
+
+def reset_session(request: gr.Request = None):
+    """Forget the follow-up conversation of this browser tab"""
+    sessions.drop(ui_session_id(request))
+    return "Session cleared. The next analysis sends the full code again."
+
+
+def list_recent_analyses(request: gr.Request = None):
+    """Render this browser session's most recent analyses as a Markdown table"""
+    if history is None:
+        return "History is disabled (set ENABLE_HISTORY=true to enable it)."
+    owner_id = owner_id_for(request)
+    if owner_id is None:
+        return "No analyses recorded yet."
+
+    records = history.recent(limit=20, owner_id=owner_id)
+    if not records:
+        return "No analyses recorded yet."
+
+    rows = ["| ID | When | Error | Model | Latency |", "|---|---|---|---|---|"]
+    for record in records:
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(record["created_at"]))
+        rows.append(
+            f"| {record['id']} | {when} | {record['error_type']} | "
+            f"{record['model']} | {record['latency_ms']} ms |"
+        )
+    return "\n".join(rows)
+
+
+def server_status():
+    """Admission queue depth, shed counters, backend throughput and parser metrics"""
+    return {
+        "admission": admission.stats(),
+        "backend": groq_fixer.backend.throughput(),
+        "parsing": PARSE_METRICS.snapshot(),
+        "sessions": len(sessions),
+    }
+
+
+def open_analysis(record_id, request: gr.Request = None):
+    """Show one of this browser session's stored analyses without a new LLM call"""
+    if history is None:
+        return "History is disabled (set ENABLE_HISTORY=true to enable it)."
+    if record_id is None:
+        return "❌ Please enter an analysis ID."
+
+    owner_id = owner_id_for(request)
+    record = history.get(int(record_id), owner_id) if owner_id else None
+    if record is None:
+        return f"❌ No analysis found with ID {int(record_id)}."
+    return formatter.format_final_output(record["sections"])
+
+
 # Create Gradio interface
 with gr.Blocks(
     theme=gr.themes.Soft(
@@ -219,6 +604,11 @@ result = example_function()""",
                         lines=15,
                         show_copy_button=True,
                     )
+                    code_file = gr.File(
+                        label="...or upload a Python file (large files keep only the parts the traceback points to)",
+                        file_types=[".py"],
+                        type="filepath",
+                    )
 
                 with gr.TabItem("Error Input"):
                     error_input = gr.Textbox(
@@ -233,6 +623,10 @@ ZeroDivisionError: division by zero""",
                         lines=10,
                         show_copy_button=True,
                     )
+                    log_file = gr.File(
+                        label="...or upload a log file (the last traceback is extracted)",
+                        type="filepath",
+                    )
 
             # Quick Examples
             with gr.Accordion("Quick Examples", open=False):
@@ -241,6 +635,42 @@ ZeroDivisionError: division by zero""",
                     example2_btn = gr.Button("API Data Handling", size="sm")
                     example3_btn = gr.Button("Database Operations", size="sm")
 
+            performance_mode = gr.Checkbox(
+                label="Performance mode: profile the code in a sandbox and target the hot path",
+                value=False,
+                visible=Config.ENABLE_PERFORMANCE_MODE,
+            )
+
+            output_mode = gr.Radio(
+                choices=[
+                    ("Full code listings", "text"),
+                    ("Patches (unified diffs, fewer tokens on large files)", "patch"),
+                    ("Structured JSON (schema-validated)", "json"),
+                ],
+                value=Config.OUTPUT_MODE,
+                label="Solution format",
+            )
+
+            with gr.Row():
+                follow_up = gr.Checkbox(
+                    label="Follow-up mode: on resubmit, send only the code changes and the new error",
+                    value=False,
+                )
+                new_session_btn = gr.Button("Start new session", size="sm")
+
+            # Past analyses
+            with gr.Accordion("Recent Analyses", open=False):
+                history_table = gr.Markdown()
+                with gr.Row():
+                    history_id = gr.Number(label="Analysis ID", precision=0)
+                    refresh_history_btn = gr.Button("Refresh", size="sm")
+                    open_history_btn = gr.Button("Open", size="sm")
+
+            # Queue and load-shedding metrics
+            with gr.Accordion("Server Status", open=False):
+                status_json = gr.JSON()
+                refresh_status_btn = gr.Button("Refresh", size="sm")
+
             # Analyze Button
             analyze_btn = gr.Button(
                 "🔍 Analyze & Generate Fixes",
@@ -349,7 +779,27 @@ for price in prices:
 TypeError: unsupported operand type(s) for *: 'str' and 'float'"""
 
     # Connect the main button
-    analyze_btn.click(fn=analyze_code, inputs=[code_input, error_input], outputs=output)
+    analyze_btn.click(
+        fn=analyze_code,
+        inputs=[
+            code_input,
+            error_input,
+            performance_mode,
+            output_mode,
+            follow_up,
+            code_file,
+            log_file,
+        ],
+        outputs=output,
+        api_name="analyze",
+    )
+
+    # Connect history controls
+    refresh_history_btn.click(fn=list_recent_analyses, outputs=history_table)
+    open_history_btn.click(fn=open_analysis, inputs=history_id, outputs=output)
+
+    refresh_status_btn.click(fn=server_status, outputs=status_json)
+    new_session_btn.click(fn=reset_session, outputs=output)
 
     # Connect example buttons
     example1_btn.click(
@@ -366,7 +816,7 @@ TypeError: unsupported operand type(s) for *: 'str' and 'float'"""
 
 if __name__ == "__main__":
     print("🚀 Starting AI Bug Fix Advisor...")
-    print(f"📊 Using model: {Config.MODEL_NAME}")
+    print(f"📊 Using model: {Config.MODEL_NAME} ({groq_fixer.backend.name} backend)")
     print("🌐 Server starting...")
     print("📍 Open the URL below to access the application:")
     print("   http://localhost:7860")
@@ -374,17 +824,61 @@ if __name__ == "__main__":
     print("   - Make sure your GROQ_API_KEY is set in the .env file")
     print("   - Try the example buttons to quickly test the system")
     print("   - Each analysis provides three different solution approaches")
+    if Config.ENABLE_JSON_API:
+        print("   - JSON API: POST http://localhost:7860/api/v1/analyze")
 
     try:
-        demo.launch(
-            share=False,
-            server_name="0.0.0.0",
-            server_port=7860,
-            show_error=True,
-            show_api=False,
-            quiet=False,
-            inbrowser=True,
-        )
+        # Let enough requests through Gradio's own queue that waiting happens
+        # in the admission controller, where it is fair and can shed early
+        worker_count = Config.MAX_CONCURRENT_REQUESTS + Config.MAX_QUEUE_DEPTH
+        demo.queue(default_concurrency_limit=worker_count)
+        max_threads = max(40, worker_count + 8)
+
+        if Config.ENABLE_JSON_API:
+            # Serve the JSON API and the UI from one FastAPI app so API calls
+            # skip Gradio's queue and event protocol entirely
+            from contextlib import asynccontextmanager
+
+            import anyio
+            import uvicorn
+            from fastapi import FastAPI
+            from api import build_api_router
+
+            @asynccontextmanager
+            async def lifespan(app):
+                # Sync API endpoints and Gradio handlers share anyio's thread
+                # limiter; give it the capacity demo.launch would set so API
+                # requests waiting for admission do not starve the UI
+                anyio.to_thread.current_default_thread_limiter().total_tokens = (
+                    max_threads
+                )
+                yield
+
+            server = FastAPI(title="AI Bug Fix Advisor API", lifespan=lifespan)
+            server.include_router(
+                build_api_router(run_pipeline, server_status, sessions.create)
+            )
+            # Settings demo.launch would otherwise apply
+            demo.max_threads = max_threads
+            demo.show_api = False
+            server = gr.mount_gradio_app(server, demo, path="/")
+            uvicorn.run(
+                server,
+                host="0.0.0.0",
+                port=7860,
+                timeout_keep_alive=Config.API_KEEPALIVE_SECONDS,
+            )
+        else:
+            demo.launch(
+                share=False,
+                max_threads=max_threads,
+                server_name="0.0.0.0",
+                server_port=7860,
+                show_error=True,
+                show_api=False,
+                quiet=False,
+                inbrowser=True,
+            )
     except Exception as e:
         print(f"❌ Failed to start server: {e}")
         print("💡 Try changing the port: python app.py --port 7861")
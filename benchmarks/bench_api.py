@@ -0,0 +1,109 @@
+"""Per-request overhead of the JSON API compared with the Gradio path.
+
+Start the app first (python app.py, with ENABLE_JSON_API=true and history
+enabled), then run from the project root:
+
+    python benchmarks/bench_api.py [requests] [base_url]
+
+The same (code, traceback) pair is sent every time. After the first call
+it is served from the analysis history, so no LLM call is made and the
+timings measure only the serving path of each interface. History is kept
+per owner, so the JSON requests carry one API session id and the Gradio
+client keeps its session hash.
+"""
+
+import http.client
+import json
+import statistics
+import sys
+import time
+from urllib.parse import urlparse
+
+CODE = """def example_function():
+    numbers = []
+    average = sum(numbers) / len(numbers)
+    return average
+
+result = example_function()"""
+
+TRACEBACK = """Traceback (most recent call last):
+  File "example.py", line 6, in <module>
+    result = example_function()
+  File "example.py", line 3, in example_function
+    average = sum(numbers) / len(numbers)
+ZeroDivisionError: division by zero"""
+
+
+def time_calls(call, count: int) -> list:
+    call()  # warm up and populate history
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: list):
+    timings = sorted(timings)
+    print(
+        f"{name:<26} median {statistics.median(timings) * 1000:8.1f}ms   "
+        f"p95 {timings[int(len(timings) * 0.95) - 1] * 1000:8.1f}ms"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    base_url = sys.argv[2] if len(sys.argv) > 2 else "http://localhost:7860"
+    url = urlparse(base_url)
+    headers = {"Content-Type": "application/json"}
+
+    # One persistent connection: keep-alive is part of what is measured
+    connection = http.client.HTTPConnection(url.hostname, url.port)
+    connection.request("POST", "/api/v1/sessions", "{}", headers)
+    session_id = json.loads(connection.getresponse().read())["session_id"]
+    body = json.dumps(
+        {
+            "code": CODE,
+            "traceback": TRACEBACK,
+            "performance_mode": False,
+            "output_mode": "text",
+            "session_id": session_id,
+        }
+    )
+
+    def json_api():
+        connection.request("POST", "/api/v1/analyze", body, headers)
+        response = connection.getresponse()
+        payload = json.loads(response.read())
+        assert response.status == 200, payload
+
+    def json_api_new_connection():
+        fresh = http.client.HTTPConnection(url.hostname, url.port)
+        fresh.request("POST", "/api/v1/analyze", body, headers)
+        fresh.getresponse().read()
+        fresh.close()
+
+    report("JSON API (keep-alive)", time_calls(json_api, count))
+    report("JSON API (new connection)", time_calls(json_api_new_connection, count))
+
+    try:
+        from gradio_client import Client
+    except ImportError:
+        print("gradio_client not installed; skipping the Gradio path")
+        return
+
+    client = Client(base_url, verbose=False)
+
+    def gradio_path():
+        # Every input of the endpoint, matching the JSON request: text output,
+        # no performance or follow-up mode and no uploads
+        client.predict(
+            CODE, TRACEBACK, False, "text", False, None, None, api_name="/analyze"
+        )
+
+    report("Gradio queue + UI handler", time_calls(gradio_path, count))
+
+
+if __name__ == "__main__":
+    main()
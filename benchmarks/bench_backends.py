@@ -0,0 +1,55 @@
+"""Measure throughput of an LLM backend under concurrent load.
+
+Run from the project root:
+    python benchmarks/bench_backends.py [backend] [requests] [concurrency]
+
+The backend defaults to LLM_BACKEND; use "llamacpp" with LOCAL_MODEL_PATH
+set for an offline, deterministic run (temperature 0).
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_backends import create_backend
+
+PROMPT = """ERROR MESSAGE:
+Traceback (most recent call last):
+  File "example.py", line 3, in <module>
+    average = sum(numbers) / len(numbers)
+ZeroDivisionError: division by zero
+
+Explain the error in two sentences and give a one-line fix."""
+
+
+def main():
+    backend = create_backend(sys.argv[1] if len(sys.argv) > 1 else None)
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    messages = [{"role": "user", "content": PROMPT}]
+
+    def one(_):
+        return backend.complete(messages, temperature=0.0, max_tokens=128)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - start
+
+    latencies = sorted(result["latency"] for result in results)
+    completion_tokens = sum(result["completion_tokens"] or 0 for result in results)
+    print(f"backend: {backend.name} ({backend.model})")
+    print(f"requests: {total} at concurrency {concurrency} in {wall:.2f}s")
+    print(f"throughput: {total / wall:.2f} req/s, {completion_tokens / wall:.1f} completion tok/s")
+    print(
+        f"latency p50: {latencies[len(latencies) // 2]:.2f}s, "
+        f"p95: {latencies[int(len(latencies) * 0.95) - 1]:.2f}s"
+    )
+    print(f"backend counters: {backend.throughput()}")
+
+
+if __name__ == "__main__":
+    main()
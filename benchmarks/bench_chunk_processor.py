@@ -0,0 +1,100 @@
+"""Compare peak memory and time of SourceText-based chunking against the
+previous split-per-call implementation on a large generated source file.
+
+Run from the project root:  python benchmarks/bench_chunk_processor.py [lines]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from utils.chunk_processor import ChunkProcessor, SourceText
+
+
+def legacy_chunk_code(code, chunk_size, overlap_size):
+    lines = code.split("\n")
+    if len(lines) <= chunk_size:
+        return [code]
+    chunks = []
+    i = 0
+    while i < len(lines):
+        chunk_end = min(i + chunk_size, len(lines))
+        chunk_lines = lines[i:chunk_end]
+        if i > 0 and overlap_size > 0:
+            overlap_start = max(0, i - overlap_size)
+            chunk_lines = lines[overlap_start:i] + chunk_lines
+        chunks.append("\n".join(chunk_lines))
+        i += chunk_size - overlap_size
+    return chunks
+
+
+def legacy_get_error_context(code, error_line, context_lines):
+    lines = code.split("\n")
+    error_line_idx = max(0, error_line - 1)
+    start_line = max(0, error_line_idx - context_lines)
+    end_line = min(len(lines), error_line_idx + context_lines + 1)
+    numbered_context = []
+    for i, line in enumerate(lines[start_line:end_line], start=start_line + 1):
+        marker = ">>> " if i == error_line else "    "
+        numbered_context.append(f"{marker}Line {i}: {line}")
+    return "\n".join(numbered_context)
+
+
+def legacy_request(code, error_line):
+    """What one request did before: split for context, then split to chunk"""
+    legacy_get_error_context(code, error_line, Config.CONTEXT_LINES)
+    chunks = legacy_chunk_code(code, Config.CHUNK_SIZE, Config.OVERLAP_SIZE)
+    return sum(len(chunk) for chunk in chunks)
+
+
+def indexed_request(code, error_line):
+    """One shared SourceText; chunks are produced and dropped one at a time"""
+    processor = ChunkProcessor()
+    source = SourceText(code)
+    processor.get_error_context(source, error_line)
+    return sum(len(chunk) for chunk in processor.iter_chunks(source))
+
+
+def measure(fn, code, error_line, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(code, error_line)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(code, error_line)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    code = "\n".join(
+        f"    value_{i} = compute(value_{i - 1}, {i}) + offset  # step {i}"
+        for i in range(line_count)
+    )
+    error_line = line_count // 2
+
+    # Both paths must produce the same chunks before timing them
+    assert legacy_chunk_code(
+        code, Config.CHUNK_SIZE, Config.OVERLAP_SIZE
+    ) == ChunkProcessor().chunk_code(code)
+    assert legacy_get_error_context(
+        code, error_line, Config.CONTEXT_LINES
+    ) == ChunkProcessor().get_error_context(code, error_line)
+
+    print(f"{line_count} lines, {len(code) / 1e6:.1f} MB of source")
+    print(f"{'implementation':<16}{'best time':>12}{'peak memory':>16}")
+    for name, fn in (("split per call", legacy_request), ("SourceText", indexed_request)):
+        best, peak = measure(fn, code, error_line)
+        print(f"{name:<16}{best * 1000:>10.1f}ms{peak / 1e6:>14.2f}MB")
+
+
+if __name__ == "__main__":
+    main()
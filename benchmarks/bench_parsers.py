@@ -0,0 +1,130 @@
+"""Worst-case benchmark and fuzz run for every text parser.
+
+Feeds pathological and random inputs to the traceback and response parsers
+and exits with status 1 if any call exceeds its time budget.
+
+Run from the project root:  python benchmarks/bench_parsers.py [fuzz_cases]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.chunk_processor import ChunkProcessor
+from utils.formatters import JsonSectionStream, OutputFormatter
+
+# Generous for linear parsers on these sizes, far below what a quadratic
+# or exponential regex needs
+TIME_BUDGET_SECONDS = 0.5
+SIZE = 1_000_000
+
+processor = ChunkProcessor()
+
+PARSERS = {
+    "extract_error_details": processor.extract_error_details,
+    "parse_ai_response": OutputFormatter.parse_ai_response,
+    "parse_partial_response": OutputFormatter.parse_partial_response,
+    "_parse_with_regex": OutputFormatter._parse_with_regex,
+    "_parse_fallback": OutputFormatter._parse_fallback,
+    "extract_code_blocks": OutputFormatter.extract_code_blocks,
+    "parse_json_response": OutputFormatter.parse_json_response,
+    "JsonSectionStream.feed": lambda text: JsonSectionStream().feed(text),
+}
+
+
+def pathological_inputs():
+    """Inputs aimed at the backtracking hot spots of the old patterns"""
+    yield "file-quotes", 'File "' * (SIZE // 6)
+    yield "frame-no-newline", 'File "a.py", line 1' + "x" * SIZE
+    yield "frame-then-word", 'File "a.py", line 1\n' + "a" * SIZE
+    yield "long-word-no-colon", "a" * SIZE
+    yield "long-word-colon", "a" * SIZE + ":"
+    yield "error-suffix-spam", "Error" * (SIZE // 5)
+    yield "colon-spaces", ": " * (SIZE // 2)
+    yield "many-frames", 'File "a.py", line 1, in f\n' * (SIZE // 26)
+    yield "explanation-no-solutions", "ERROR EXPLANATION:" + " " * SIZE
+    yield "repeated-headers", "ERROR EXPLANATION:" * (SIZE // 18)
+    yield "solution-prefix-spam", "SOLUTION " * (SIZE // 9)
+    yield "solution-marker-spam", "SOLUTION 1 (SIMPLE FIX):SOLUTION 2" * (SIZE // 34)
+    yield "unclosed-fences", "```" * (SIZE // 3)
+    yield "fence-no-newline", "```python" + "x" * SIZE
+    yield "single-long-line", "x" * SIZE + "\n" + "SOLUTION 3:" + "y" * SIZE
+    yield "many-short-lines", "ALTERNATIVE\n" * (SIZE // 12)
+    yield "json-deep-nesting", "{" + "[" * SIZE
+    yield "json-unterminated-string", '{"explanation": "' + "\\\"" * (SIZE // 2)
+    yield "json-many-members", "{" + '"k": 1, ' * (SIZE // 8) + "}"
+
+
+def fuzz_inputs(cases: int, seed: int = 0):
+    """Random mixes of the tokens the parsers care about"""
+    tokens = [
+        "ERROR EXPLANATION:",
+        "SOLUTION 1 (SIMPLE FIX):",
+        "SOLUTION 2 (TRY-EXCEPT HANDLING):",
+        "SOLUTION 3 (ALTERNATIVE APPROACH):",
+        "SOLUTION 1:",
+        "SOLUTION ",
+        "Traceback (most recent call last):\n",
+        '  File "',
+        '", line ',
+        "ValueError: ",
+        "Error",
+        ": ",
+        "```python\n",
+        "```",
+        '{"explanation": "',
+        '"solution1": {"description": "',
+        '", "code": "',
+        "}",
+        "\\",
+        "\n",
+        "    ",
+        '"',
+        "a" * 50,
+        "9" * 20,
+    ]
+    rng = random.Random(seed)
+    for case in range(cases):
+        pieces = rng.choices(tokens, k=rng.randint(1, 5000))
+        yield f"fuzz-{case}", "".join(pieces)
+
+
+def run(name: str, text: str, failures: list) -> float:
+    worst = 0.0
+    for parser_name, parser in PARSERS.items():
+        start = time.perf_counter()
+        parser(text)
+        elapsed = time.perf_counter() - start
+        worst = max(worst, elapsed)
+        if elapsed > TIME_BUDGET_SECONDS:
+            failures.append((name, parser_name, elapsed))
+    return worst
+
+
+def main():
+    cases = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    failures = []
+
+    print(f"{'input':<28}{'chars':>10}{'worst parser':>16}")
+    for name, text in pathological_inputs():
+        worst = run(name, text, failures)
+        print(f"{name:<28}{len(text):>10}{worst * 1000:>14.1f}ms")
+
+    worst_fuzz = 0.0
+    for name, text in fuzz_inputs(cases):
+        worst_fuzz = max(worst_fuzz, run(name, text, failures))
+    print(f"{f'{cases} fuzz cases':<28}{'':>10}{worst_fuzz * 1000:>14.1f}ms")
+
+    if failures:
+        print(f"\nFAILED: {len(failures)} parser calls exceeded {TIME_BUDGET_SECONDS}s")
+        for name, parser_name, elapsed in failures:
+            print(f"  {parser_name} on {name}: {elapsed:.2f}s")
+        sys.exit(1)
+    print(f"\nOK: every parser call finished within {TIME_BUDGET_SECONDS}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,117 @@
 import re
+from array import array
 from config import Config
 
 
+class SourceText:
+    """Source string plus a compact index of line start offsets.
+
+    Built once per request so that chunking and context extraction can
+    slice any line range directly instead of re-splitting the whole code.
+    """
+
+    __slots__ = ("text", "_offsets")
+
+    def __init__(self, text: str):
+        self.text = text
+        # 'I' holds offsets up to 4 GiB; fall back to 64-bit beyond that
+        offsets = array("I" if len(text) < 2**32 else "Q", [0])
+        find = text.find
+        append = offsets.append
+        position = find("\n")
+        while position != -1:
+            append(position + 1)
+            position = find("\n", position + 1)
+        self._offsets = offsets
+
+    @classmethod
+    def of(cls, code) -> "SourceText":
+        """Wrap a string, or return an existing SourceText unchanged"""
+        return code if isinstance(code, cls) else cls(code)
+
+    def __len__(self) -> int:
+        """Number of lines; a trailing newline counts as an empty last line"""
+        return len(self._offsets)
+
+    def _end_offset(self, line_idx: int) -> int:
+        # End of a line, excluding its newline
+        if line_idx + 1 < len(self._offsets):
+            return self._offsets[line_idx + 1] - 1
+        return len(self.text)
+
+    def line(self, line_idx: int) -> str:
+        """Single line by 0-based index, without its newline"""
+        return self.text[self._offsets[line_idx] : self._end_offset(line_idx)]
+
+    def slice_lines(self, start: int, end: int) -> str:
+        """Lines [start, end) joined by newlines, as one slice of the original"""
+        start = max(0, start)
+        end = min(len(self._offsets), end)
+        if start >= end:
+            return ""
+        return self.text[self._offsets[start] : self._end_offset(end - 1)]
+
+    def iter_lines(self, start: int = 0, end: int = None):
+        """Yield lines [start, end) lazily"""
+        end = len(self._offsets) if end is None else min(len(self._offsets), end)
+        for line_idx in range(max(0, start), end):
+            yield self.line(line_idx)
+
+
 class ChunkProcessor:
     def __init__(self):
         self.chunk_size = Config.CHUNK_SIZE
         self.overlap_size = Config.OVERLAP_SIZE
         self.context_lines = Config.CONTEXT_LINES
 
-    def chunk_code(self, code: str) -> list:
+    def chunk_code(self, code) -> list:
         """Split code into chunks with overlapping context for better error understanding"""
-        if not code or len(code.strip()) == 0:
-            return []
+        return list(self.iter_chunks(code))
+
+    def iter_chunks(self, code):
+        """Lazily yield chunks; accepts a string or a SourceText"""
+        if not code:
+            return
+        source = SourceText.of(code)
+        if len(source.text.strip()) == 0:
+            return
 
-        lines = code.split("\n")
+        line_count = len(source)
 
         # If code is small enough, return as single chunk
-        if len(lines) <= self.chunk_size:
-            return [code]
+        if line_count <= self.chunk_size:
+            yield source.text
+            return
 
-        chunks = []
+        step = max(1, self.chunk_size - self.overlap_size)
         i = 0
 
-        while i < len(lines):
+        while i < line_count:
             # Calculate chunk end
-            chunk_end = min(i + self.chunk_size, len(lines))
+            chunk_end = min(i + self.chunk_size, line_count)
 
-            # Extract chunk
-            chunk_lines = lines[i:chunk_end]
-
-            # Add overlapping context from previous chunk if not first chunk
+            # Include overlapping context from previous chunk if not first chunk;
+            # overlap and chunk are contiguous, so this is a single slice
+            chunk_start = i
             if i > 0 and self.overlap_size > 0:
-                overlap_start = max(0, i - self.overlap_size)
-                overlap_lines = lines[overlap_start:i]
-                chunk_lines = overlap_lines + chunk_lines
+                chunk_start = max(0, i - self.overlap_size)
 
-            chunks.append("\n".join(chunk_lines))
+            yield source.slice_lines(chunk_start, chunk_end)
 
             # Move to next chunk position
-            i += self.chunk_size - self.overlap_size
-
-        return chunks
+            i += step
 
-    def get_error_context(self, code: str, error_line: int) -> str:
+    def get_error_context(self, code, error_line: int) -> str:
         """Extract context around the error line for better analysis"""
-        lines = code.split("\n")
+        source = SourceText.of(code)
 
         # Adjust for 0-based indexing
         error_line_idx = max(0, error_line - 1)
 
         start_line = max(0, error_line_idx - self.context_lines)
-        end_line = min(len(lines), error_line_idx + self.context_lines + 1)
+        end_line = min(len(source), error_line_idx + self.context_lines + 1)
 
-        context_lines = lines[start_line:end_line]
+        context_lines = source.iter_lines(start_line, end_line)
 
         # Add line numbers for clarity
         numbered_context = []
@@ -63,7 +122,12 @@ class ChunkProcessor:
         return "\n".join(numbered_context)
 
     def extract_error_details(self, error_traceback: str) -> dict:
-        """Extract key error details from traceback"""
+        """Extract key error details from traceback.
+
+        Runs in linear time: the input is capped to its tail, every line is
+        capped in length, and each line is matched against anchored patterns
+        that cannot backtrack across lines.
+        """
         error_details = {
             "error_type": "UnknownError",
             "error_message": "Unknown error",
@@ -72,28 +136,71 @@ class ChunkProcessor:
         }
 
         try:
-            # Pattern to match Python traceback error lines
-            patterns = [
-                r'File "([^"]+)", line (\d+).*\n.*(\w+): (.+)',
-                r"(\w+Error): (.+)",
-                r"(\w+): (.+)",
+            # The final exception is at the end, so keep the tail of huge pastes
+            if len(error_traceback) > Config.MAX_TRACEBACK_CHARS:
+                error_traceback = error_traceback[-Config.MAX_TRACEBACK_CHARS :]
+            lines = [
+                line[: Config.MAX_LINE_CHARS] for line in error_traceback.splitlines()
             ]
 
-            for pattern in patterns:
-                match = re.search(pattern, error_traceback)
+            # Frames: report the last one in the same file as the first frame,
+            # which is normally the user's script rather than a library
+            frames = []
+            for line in lines:
+                match = _FRAME_PATTERN.match(line)
+                if match:
+                    frames.append((match.group(1), int(match.group(2))))
+            if frames:
+                user_file = frames[0][0]
+                file_name, line_number = [f for f in frames if f[0] == user_file][-1]
+                error_details["file_name"] = file_name
+                error_details["line_number"] = line_number
+
+            # Exception line: the last unindented "Name: message" or bare "Name"
+            for line in reversed(lines):
+                match = _EXCEPTION_PATTERN.match(line.rstrip())
                 if match:
-                    if len(match.groups()) == 4:
-                        error_details["file_name"] = match.group(1)
-                        error_details["line_number"] = int(match.group(2))
-                        error_details["error_type"] = match.group(3)
-                        error_details["error_message"] = match.group(4)
-                    elif len(match.groups()) == 2:
-                        error_details["error_type"] = match.group(1)
+                    error_details["error_type"] = match.group(1).rsplit(".", 1)[-1]
+                    if match.group(2) is not None:
                         error_details["error_message"] = match.group(2)
-                    break
+                    return error_details
+
+            # Otherwise any "SomethingError: message" or "word: message"
+            for suffix in ("Error: ", ": "):
+                for line in lines:
+                    found = _split_name_and_message(line, suffix)
+                    if found:
+                        error_details["error_type"], error_details["error_message"] = (
+                            found
+                        )
+                        return error_details
 
             return error_details
         except Exception as e:
             if Config.DEBUG_MODE:
                 print(f"Debug: Error parsing failed: {e}")
             return error_details
+
+
+# Bounded, line-anchored patterns used by extract_error_details
+_FRAME_PATTERN = re.compile(r'\s{0,16}File "([^"]{1,1024})", line (\d{1,9})')
+_EXCEPTION_PATTERN = re.compile(
+    r"([A-Za-z_][\w.]{0,199}(?:Error|Exception|Warning|Interrupt|Exit|Iteration))(?:: ?(.*))?$"
+)
+
+
+def _split_name_and_message(line: str, suffix: str):
+    """Find "<word><suffix><message>" without regex backtracking"""
+    index = line.find(suffix)
+    if index == -1:
+        return None
+    name_end = index + len(suffix) - 2
+    name_start = name_end
+    while name_start > 0 and (
+        line[name_start - 1].isalnum() or line[name_start - 1] == "_"
+    ):
+        name_start -= 1
+    message = line[index + len(suffix) :].strip()
+    if name_start == name_end or not message:
+        return None
+    return line[name_start:name_end], message
@@ -10,6 +10,13 @@ class Config:
     MODEL_NAME = os.getenv("MODEL_NAME", "llama-3.3-70b-versatile")
     DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "llama-3.3-70b-versatile")
 
+    # LLM Backend Settings ("groq" or "llamacpp")
+    LLM_BACKEND = os.getenv("LLM_BACKEND", "groq").lower()
+    LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH", "")
+    LOCAL_MODEL_CONTEXT = int(os.getenv("LOCAL_MODEL_CONTEXT", 8192))
+    LOCAL_MODEL_THREADS = int(os.getenv("LOCAL_MODEL_THREADS", 0))  # 0 = all cores
+    LOCAL_MODEL_BATCH_SIZE = int(os.getenv("LOCAL_MODEL_BATCH_SIZE", 512))
+
     # Processing Settings
     CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1500))
     OVERLAP_SIZE = int(os.getenv("OVERLAP_SIZE", 150))
@@ -17,12 +24,84 @@ class Config:
     TEMPERATURE = float(os.getenv("TEMPERATURE", 0.8))  # Increased for diversity
     CONTEXT_LINES = int(os.getenv("CONTEXT_LINES", 5))
 
+    # Parser input caps (keep parsing time bounded on hostile pastes)
+    MAX_TRACEBACK_CHARS = int(os.getenv("MAX_TRACEBACK_CHARS", 100_000))
+    MAX_LINE_CHARS = int(os.getenv("MAX_LINE_CHARS", 2_000))
+    MAX_RESPONSE_CHARS = int(os.getenv("MAX_RESPONSE_CHARS", 200_000))
+
+    # Upload Settings (larger code files keep only the regions around frames)
+    MAX_UPLOAD_CODE_CHARS = int(os.getenv("MAX_UPLOAD_CODE_CHARS", 200_000))
+    UPLOAD_CONTEXT_LINES = int(os.getenv("UPLOAD_CONTEXT_LINES", 40))
+
     # Application Settings
     ENABLE_CHUNKING = os.getenv("ENABLE_CHUNKING", "true").lower() == "true"
     DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
 
+    # Deadline Settings
+    REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", 45))
+    # Time kept back from the LLM call to assemble a degraded answer
+    DEADLINE_RESERVE_SECONDS = float(os.getenv("DEADLINE_RESERVE_SECONDS", 2))
+
+    # Admission Control Settings
+    MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", 4))
+    MAX_QUEUE_DEPTH = int(os.getenv("MAX_QUEUE_DEPTH", 32))
+    # UI requests are counted per browser session; JSON API requests per
+    # client address, so API callers behind one NAT or proxy share the limit
+    MAX_QUEUE_PER_CLIENT = int(os.getenv("MAX_QUEUE_PER_CLIENT", 3))
+    UPSTREAM_TOKENS_PER_MINUTE = int(os.getenv("UPSTREAM_TOKENS_PER_MINUTE", 12000))
+    MAX_QUEUE_WAIT = float(os.getenv("MAX_QUEUE_WAIT", 60))
+
+    # Output Settings ("text" = full code listings, "patch" = unified diffs,
+    # "json" = schema-validated JSON sections)
+    OUTPUT_MODE = os.getenv("OUTPUT_MODE", "text").lower()
+    PATCH_SANDBOX_VALIDATION = (
+        os.getenv("PATCH_SANDBOX_VALIDATION", "false").lower() == "true"
+    )
+
+    # Performance Profiling Settings. The sandbox caps memory and CPU time
+    # and drops the server's environment variables, but does NOT isolate the
+    # filesystem or the network: submitted code can read the server's files
+    # (such as .env). Only enable it for trusted users.
+    ENABLE_PERFORMANCE_MODE = (
+        os.getenv("ENABLE_PERFORMANCE_MODE", "false").lower() == "true"
+    )
+    # Sandbox runs executing at once across all requests
+    MAX_CONCURRENT_PROFILES = int(os.getenv("MAX_CONCURRENT_PROFILES", 2))
+    PROFILE_TIME_BUDGET = float(os.getenv("PROFILE_TIME_BUDGET", 10))
+    PROFILE_MEMORY_LIMIT_MB = int(os.getenv("PROFILE_MEMORY_LIMIT_MB", 1024))
+    PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", 8))
+
+    # JSON API Settings
+    ENABLE_JSON_API = os.getenv("ENABLE_JSON_API", "true").lower() == "true"
+    API_BATCH_CONCURRENCY = int(os.getenv("API_BATCH_CONCURRENCY", 4))
+    API_MAX_BATCH_ITEMS = int(os.getenv("API_MAX_BATCH_ITEMS", 50))
+    API_KEEPALIVE_SECONDS = int(os.getenv("API_KEEPALIVE_SECONDS", 30))
+
+    # Session Settings (follow-up turns for edited resubmissions)
+    MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", 256))
+    SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", 3600))
+    # Conversation size at which earlier turns are replaced by a summary
+    SESSION_COMPACT_TOKENS = int(os.getenv("SESSION_COMPACT_TOKENS", 6000))
+    # Send the full code instead when the diff is this large relative to it
+    SESSION_MAX_DIFF_RATIO = float(os.getenv("SESSION_MAX_DIFF_RATIO", 0.5))
+
+    # History Settings
+    ENABLE_HISTORY = os.getenv("ENABLE_HISTORY", "true").lower() == "true"
+    HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "analysis_history.db")
+
     @classmethod
     def validate_config(cls):
+        if cls.LLM_BACKEND == "llamacpp":
+            if not os.path.exists(cls.LOCAL_MODEL_PATH):
+                raise ValueError(
+                    f"LOCAL_MODEL_PATH {cls.LOCAL_MODEL_PATH!r} does not exist"
+                )
+            cls.MODEL_NAME = os.path.basename(cls.LOCAL_MODEL_PATH)
+            print(
+                f"✅ Configuration loaded: local model {cls.MODEL_NAME} (Tokens: {cls.MAX_TOKENS}, Temp: {cls.TEMPERATURE})"
+            )
+            return
+
         if not cls.GROQ_API_KEY:
             print("❌ WARNING: GROQ_API_KEY not found in .env file.")
             print("💡 Please add your Groq API key to the .env file:")
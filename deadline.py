@@ -0,0 +1,21 @@
+import time
+
+
+class Deadline:
+    """Absolute point in time that a request must answer by"""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def sooner_by(self, seconds: float) -> "Deadline":
+        """A deadline that leaves `seconds` of headroom before this one"""
+        earlier = Deadline(0)
+        earlier.expires_at = self.expires_at - seconds
+        return earlier
@@ -1,9 +1,24 @@
-from utils.chunk_processor import ChunkProcessor
+from utils.chunk_processor import ChunkProcessor, SourceText
 from utils.formatters import OutputFormatter
 from config import Config
 import traceback
 import ast
 
+# Offline hints for common exceptions, used when no AI answer is available
+COMMON_ERROR_HINTS = {
+    "ZeroDivisionError": "A value used as a divisor is zero. Check the denominator (often an empty collection's length) before dividing.",
+    "KeyError": "A dictionary was indexed with a key it does not contain. Use `dict.get()` with a default or check `key in dict` first.",
+    "IndexError": "A sequence was indexed past its end. Check the length before indexing or iterate over the items directly.",
+    "TypeError": "An operation received a value of the wrong type. Convert the value explicitly (e.g. `int()`, `float()`, `str()`) or check its type first.",
+    "ValueError": "A function received a value of the right type but an invalid content. Validate or clean the input before converting it.",
+    "AttributeError": "The object does not have the attribute being accessed. Check for `None` and for typos in the attribute name.",
+    "NameError": "A name is used before it is defined. Check spelling, imports and the order of definitions.",
+    "FileNotFoundError": "The file path does not exist relative to the working directory. Check the path or create the file first.",
+    "ModuleNotFoundError": "The module is not installed in this environment. Install it with pip or fix the import name.",
+    "ImportError": "The import refers to a name the module does not provide. Check the module version and the imported name.",
+    "RecursionError": "A function recursed too deeply. Check the base case or rewrite the recursion as a loop.",
+}
+
 
 class ErrorParser:
     def __init__(self):
@@ -17,6 +32,9 @@ class ErrorParser:
                 f"Debug: Analyzing code length: {len(code)}, error: {error_traceback[:100]}..."
             )
 
+        # Index the code once; chunking and context extraction share it
+        source = SourceText(code)
+
         # Extract error details
         error_details = self.chunk_processor.extract_error_details(error_traceback)
 
@@ -24,7 +42,7 @@ class ErrorParser:
         enhanced_context = ""
         if error_details["line_number"]:
             enhanced_context = self.chunk_processor.get_error_context(
-                code, error_details["line_number"]
+                source, error_details["line_number"]
             )
             if Config.DEBUG_MODE:
                 print(
@@ -36,10 +54,41 @@ class ErrorParser:
             "needs_chunking": len(code) > Config.CHUNK_SIZE,
             "enhanced_context": enhanced_context,
             "code_length": len(code),
+            "source": source,
         }
 
         return analysis_result
 
+    def explain_locally(self, analysis: dict) -> dict:
+        """Best-effort explanation from the traceback alone, without the LLM"""
+        details = analysis["error_details"]
+        location = ""
+        if details["line_number"]:
+            location = f" at line {details['line_number']}"
+            if details["file_name"]:
+                location += f" of `{details['file_name']}`"
+
+        explanation = [
+            f"**{details['error_type']}**{location}: {details['error_message']}"
+        ]
+        hint = COMMON_ERROR_HINTS.get(details["error_type"])
+        if hint:
+            explanation.append("")
+            explanation.append(hint)
+        if analysis.get("enhanced_context"):
+            explanation.append("")
+            explanation.append("```")
+            explanation.append(analysis["enhanced_context"])
+            explanation.append("```")
+
+        unavailable = "Not available: the AI did not answer in time. Please retry."
+        return {
+            "explanation": "\n".join(explanation),
+            "solution1": unavailable,
+            "solution2": unavailable,
+            "solution3": unavailable,
+        }
+
     def prepare_for_ai(self, code: str, error_traceback: str, analysis: dict) -> tuple:
         """Prepare data for AI processing"""
         processing_method = "direct"
@@ -47,9 +96,10 @@ class ErrorParser:
 
         if analysis["needs_chunking"] and Config.ENABLE_CHUNKING:
             processing_method = "chunked"
-            chunks = self.chunk_processor.chunk_code(code)
             if Config.DEBUG_MODE:
-                print(f"Debug: Code split into {len(chunks)} chunks")
+                source = analysis.get("source") or code
+                chunk_count = sum(1 for _ in self.chunk_processor.iter_chunks(source))
+                print(f"Debug: Code split into {chunk_count} chunks")
 
         return processing_method, content_to_process
 
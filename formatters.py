@@ -1,11 +1,45 @@
+import bisect
+import json
 import re
+import threading
+import time
 from config import Config
 
+_SOLUTION_MARKER = re.compile(r"SOLUTION ([123])", re.IGNORECASE)
+
+# Section header -> marker digits that end the section
+_STANDARD_HEADERS = {
+    "explanation": (re.compile(r"ERROR EXPLANATION:", re.IGNORECASE), "123"),
+    "solution1": (re.compile(r"SOLUTION 1 \(SIMPLE FIX\):", re.IGNORECASE), "23"),
+    "solution2": (
+        re.compile(r"SOLUTION 2 \(TRY-EXCEPT HANDLING\):", re.IGNORECASE),
+        "3",
+    ),
+    "solution3": (
+        re.compile(r"SOLUTION 3 \(ALTERNATIVE APPROACH\):", re.IGNORECASE),
+        "",
+    ),
+}
+_ALTERNATIVE_HEADERS = {
+    "explanation": (re.compile(r"ERROR EXPLANATION:", re.IGNORECASE), "1"),
+    "solution1": (re.compile(r"SOLUTION 1:", re.IGNORECASE), "2"),
+    "solution2": (re.compile(r"SOLUTION 2:", re.IGNORECASE), "3"),
+    "solution3": (re.compile(r"SOLUTION 3:", re.IGNORECASE), ""),
+}
+
 
 class OutputFormatter:
     @staticmethod
     def parse_ai_response(response: str) -> dict:
         """Parse AI response into structured format with robust error handling"""
+        start = time.perf_counter()
+        sections, parsed = OutputFormatter._parse_text_response(response)
+        PARSE_METRICS.record("text", time.perf_counter() - start, parsed)
+        return sections
+
+    @staticmethod
+    def _parse_text_response(response: str) -> tuple:
+        """Section scraping; returns (sections, whether any strategy matched)"""
         sections = {
             "explanation": "No explanation provided",
             "solution1": "No simple fix provided",
@@ -13,26 +47,70 @@ class OutputFormatter:
             "solution3": "No alternative approach provided",
         }
 
-        # Clean the response
-        response = response.strip()
+        # Clean the response; anything past the cap is not a real answer
+        response = response[: Config.MAX_RESPONSE_CHARS].strip()
 
         # Multiple parsing strategies
         parsed = OutputFormatter._parse_with_regex(response)
         if parsed:
-            return parsed
+            return parsed, True
 
         # Fallback parsing
         parsed = OutputFormatter._parse_fallback(response)
         if parsed:
-            return parsed
+            return parsed, True
 
         # Ultimate fallback - return the raw response
         sections["explanation"] = response
-        return sections
+        return sections, False
+
+    @staticmethod
+    def parse_json_response(response: str, stream: "JsonSectionStream" = None) -> dict:
+        """Parse a JSON-mode response, falling back to section scraping.
+
+        If the response was already fed to a JsonSectionStream while it
+        streamed, pass it in so only schema validation is left to do.
+        """
+        start = time.perf_counter()
+        if stream is None:
+            stream = JsonSectionStream()
+            stream.feed(response[: Config.MAX_RESPONSE_CHARS])
+        errors = validate_json_sections(stream.members) if stream.complete else [
+            "response is not a complete JSON object"
+        ]
+        PARSE_METRICS.record(
+            "json", time.perf_counter() - start + stream.parse_seconds, not errors
+        )
+        if not errors:
+            return json_to_sections(stream.members)
+
+        if Config.DEBUG_MODE:
+            print(f"Debug: JSON output invalid ({'; '.join(errors)}), using text parser")
+        return OutputFormatter._parse_text_response(response)[0]
+
+    @staticmethod
+    def parse_partial_response(response: str) -> dict:
+        """Parse a possibly truncated response, keeping only sections with content"""
+        response = response[: Config.MAX_RESPONSE_CHARS].strip()
+        if not response:
+            return {}
+
+        parsed = OutputFormatter._parse_with_regex(
+            response
+        ) or OutputFormatter._parse_fallback(response)
+        if not parsed:
+            # No section headers yet: whatever arrived is the explanation
+            return {"explanation": response}
+        return {key: value for key, value in parsed.items() if value.strip()}
 
     @staticmethod
     def _parse_with_regex(response: str) -> dict:
-        """Parse using regex patterns"""
+        """Parse using section headers.
+
+        Each section runs from its header to the next "SOLUTION n" marker
+        that may follow it. Headers and markers are located with one literal
+        scan each, so parsing is linear in the response length.
+        """
         sections = {
             "explanation": "",
             "solution1": "",
@@ -41,69 +119,21 @@ class OutputFormatter:
         }
 
         try:
-            # More flexible regex patterns - Pattern 1: Standard format
-            patterns = [
-                r"ERROR EXPLANATION:\s*(.*?)(?=SOLUTION 1|SOLUTION 2|SOLUTION 3|$)",
-                r"SOLUTION 1 \(SIMPLE FIX\):\s*(.*?)(?=SOLUTION 2|SOLUTION 3|$)",
-                r"SOLUTION 2 \(TRY-EXCEPT HANDLING\):\s*(.*?)(?=SOLUTION 3|$)",
-                r"SOLUTION 3 \(ALTERNATIVE APPROACH\):\s*(.*?)$",
-            ]
-
-            explanation_match = re.search(
-                patterns[0], response, re.DOTALL | re.IGNORECASE
-            )
-            solution1_match = re.search(
-                patterns[1], response, re.DOTALL | re.IGNORECASE
-            )
-            solution2_match = re.search(
-                patterns[2], response, re.DOTALL | re.IGNORECASE
-            )
-            solution3_match = re.search(
-                patterns[3], response, re.DOTALL | re.IGNORECASE
-            )
+            markers = OutputFormatter._solution_markers(response)
 
-            if explanation_match:
-                sections["explanation"] = explanation_match.group(1).strip()
-            if solution1_match:
-                sections["solution1"] = solution1_match.group(1).strip()
-            if solution2_match:
-                sections["solution2"] = solution2_match.group(1).strip()
-            if solution3_match:
-                sections["solution3"] = solution3_match.group(1).strip()
+            # Pattern 1: Standard format
+            OutputFormatter._fill_sections(
+                response, sections, markers, _STANDARD_HEADERS
+            )
 
             # If we found at least 3 sections, return
             if sum(1 for v in sections.values() if v.strip()) >= 3:
                 return sections
 
             # Pattern 2: Alternative format
-            patterns2 = [
-                r"ERROR EXPLANATION:\s*(.*?)(?=SOLUTION 1|$)",
-                r"SOLUTION 1:\s*(.*?)(?=SOLUTION 2|$)",
-                r"SOLUTION 2:\s*(.*?)(?=SOLUTION 3|$)",
-                r"SOLUTION 3:\s*(.*?)$",
-            ]
-
-            explanation_match2 = re.search(
-                patterns2[0], response, re.DOTALL | re.IGNORECASE
-            )
-            solution1_match2 = re.search(
-                patterns2[1], response, re.DOTALL | re.IGNORECASE
-            )
-            solution2_match2 = re.search(
-                patterns2[2], response, re.DOTALL | re.IGNORECASE
+            OutputFormatter._fill_sections(
+                response, sections, markers, _ALTERNATIVE_HEADERS
             )
-            solution3_match2 = re.search(
-                patterns2[3], response, re.DOTALL | re.IGNORECASE
-            )
-
-            if explanation_match2 and not sections["explanation"]:
-                sections["explanation"] = explanation_match2.group(1).strip()
-            if solution1_match2 and not sections["solution1"]:
-                sections["solution1"] = solution1_match2.group(1).strip()
-            if solution2_match2 and not sections["solution2"]:
-                sections["solution2"] = solution2_match2.group(1).strip()
-            if solution3_match2 and not sections["solution3"]:
-                sections["solution3"] = solution3_match2.group(1).strip()
 
         except Exception as e:
             if Config.DEBUG_MODE:
@@ -115,6 +145,32 @@ class OutputFormatter:
 
         return None
 
+    @staticmethod
+    def _solution_markers(response: str) -> dict:
+        """Sorted start offsets of every "SOLUTION 1/2/3" occurrence"""
+        markers = {"1": [], "2": [], "3": []}
+        for match in _SOLUTION_MARKER.finditer(response):
+            markers[match.group(1)].append(match.start())
+        return markers
+
+    @staticmethod
+    def _fill_sections(response: str, sections: dict, markers: dict, headers: dict):
+        """Fill empty sections from the first occurrence of each header"""
+        for key, (header, terminators) in headers.items():
+            if sections[key]:
+                continue
+            match = header.search(response)
+            if not match:
+                continue
+            start = match.end()
+            end = len(response)
+            for digit in terminators:
+                positions = markers[digit]
+                index = bisect.bisect_left(positions, start)
+                if index < len(positions):
+                    end = min(end, positions[index])
+            sections[key] = response[start:end].strip()
+
     @staticmethod
     def _parse_fallback(response: str) -> dict:
         """Fallback parsing using line-based approach"""
@@ -184,3 +240,401 @@ class OutputFormatter:
 {result['solution3'] if result['solution3'].strip() else 'No alternative approach provided'}
 """
         return output
+
+    @staticmethod
+    def format_degraded_notice(reason: str, sources: list) -> str:
+        """Banner shown above an answer that was not fully produced by the AI"""
+        return (
+            f"\n⚠️ **DEGRADED ANSWER** — {reason}\n\n"
+            f"This answer was assembled from {', '.join(sources)}. "
+            "Sections marked as not available were not produced; please retry for a full analysis.\n"
+        )
+
+    @staticmethod
+    def extract_code_blocks(text: str, language: str = None) -> list:
+        """Return the contents of fenced code blocks in order of appearance,
+        optionally only those whose fence names the given language"""
+        return [
+            body
+            for info, body, _, _ in OutputFormatter._iter_code_blocks(text)
+            if language is None or info.lower() == language
+        ]
+
+    @staticmethod
+    def remove_code_blocks(text: str, language: str) -> str:
+        """Text with every fenced block of the given language removed"""
+        kept = []
+        position = 0
+        for info, _, start, end in OutputFormatter._iter_code_blocks(text):
+            if info.lower() == language:
+                kept.append(text[position:start])
+                position = end
+        kept.append(text[position:])
+        return "".join(kept).strip()
+
+    @staticmethod
+    def _iter_code_blocks(text: str):
+        """Yield (info string, body, start, end) for each fenced block"""
+        position = 0
+        while True:
+            start = text.find("```", position)
+            if start == -1:
+                return
+            body_start = text.find("\n", start)
+            if body_start == -1:
+                return
+            end = text.find("```", body_start)
+            if end == -1:
+                return
+            yield text[start + 3 : body_start].strip(), text[
+                body_start + 1 : end
+            ], start, end + 3
+            position = end + 3
+
+    @staticmethod
+    def format_patch_result(patch: dict) -> str:
+        """Status line and patched file for one patch-mode solution"""
+        if patch["error"]:
+            return f"\n\n❌ *The patch could not be applied: {patch['error']}*"
+
+        status = "✅ *Patch applied"
+        if patch.get("syntax_checked", True):
+            status += "; the patched file parses"
+        if patch.get("retried"):
+            status += " (re-requested after the first patch failed)"
+        sandbox = patch.get("sandbox")
+        if sandbox is not None and sandbox["success"]:
+            status += " and runs without errors"
+        elif sandbox is not None:
+            failure = sandbox["error"].strip().splitlines() or ["non-zero exit"]
+            status += f" but fails when run: {failure[-1]}"
+        status += ".*"
+        return (
+            f"\n\n{status}\n\n<details><summary>Patched file</summary>\n\n"
+            f"```python\n{patch['patched_code']}\n```\n\n</details>"
+        )
+
+    @staticmethod
+    def format_patch_stats(stats: dict) -> str:
+        """Completion-token saving of patch mode over full rewrites"""
+        return (
+            f"\n📉 **Patch mode:** {stats['completion_tokens']} completion tokens "
+            f"(full rewrites estimated at {stats['full_rewrite_estimate']}, "
+            f"{stats['reduction_percent']:.0f}% fewer)\n"
+        )
+
+    @staticmethod
+    def format_session_stats(turns: list) -> str:
+        """Tokens and latency of every turn in a follow-up session"""
+        lines = [
+            "",
+            "🔁 **SESSION:**",
+            "",
+            "| Turn | Sent | Prompt tokens (new / full resend) | Upstream prompt | Completion | Latency |",
+            "|---|---|---|---|---|---|",
+        ]
+        for turn in turns:
+            if turn["kind"] == "follow-up":
+                sent = f"diff, {turn['diff_lines']} changed lines"
+            else:
+                sent = "full code"
+            lines.append(
+                f"| {turn['turn']} | {sent} | {turn['sent_prompt_tokens']} / "
+                f"{turn['full_prompt_tokens']} | {turn['prompt_tokens'] or '?'} | "
+                f"{turn['completion_tokens'] or '?'} | {turn['latency']:.1f}s |"
+            )
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def format_performance_report(baseline: dict, candidates: dict) -> str:
+        """Format measured timings of the original code and each solution"""
+        titles = {
+            "solution1": "Solution 1",
+            "solution2": "Solution 2",
+            "solution3": "Solution 3",
+        }
+
+        def describe(profile: dict) -> str:
+            if profile.get("error"):
+                first_line = profile["error"].strip().splitlines()[-1]
+                return f"failed ({first_line})"
+            if profile.get("timed_out"):
+                return f"still over the {profile['wall_time']:.2f}s budget"
+            return (
+                f"{profile['wall_time']:.3f}s, "
+                f"peak {profile['peak_memory_kb']} KB"
+            )
+
+        lines = ["", "⚡ **MEASURED PERFORMANCE:**"]
+        lines.append(f"- Original code: {describe(baseline)}")
+        for key, title in titles.items():
+            profile = candidates.get(key)
+            if profile is None:
+                lines.append(f"- {title}: no runnable code block")
+                continue
+            line = f"- {title}: {describe(profile)}"
+            if profile.get("speedup"):
+                prefix = "≥ " if baseline.get("timed_out") else ""
+                line += f" — **{prefix}{profile['speedup']:.1f}x** speedup"
+            lines.append(line)
+        return "\n".join(lines) + "\n"
+
+
+SECTION_KEYS = ("explanation", "solution1", "solution2", "solution3")
+
+# Shape requested in JSON output mode
+JSON_SECTIONS_SCHEMA = {
+    "explanation": str,
+    "solution1": {"description": str, "code": str},
+    "solution2": {"description": str, "code": str},
+    "solution3": {"description": str, "code": str},
+}
+
+
+def validate_json_sections(data) -> list:
+    """Check parsed JSON against JSON_SECTIONS_SCHEMA; returns error messages"""
+    if not isinstance(data, dict):
+        return ["top level must be an object"]
+
+    errors = []
+    for key, expected in JSON_SECTIONS_SCHEMA.items():
+        value = data.get(key)
+        if isinstance(expected, dict):
+            if not isinstance(value, dict):
+                errors.append(f"{key} must be an object")
+                continue
+            for field, field_type in expected.items():
+                if not isinstance(value.get(field), field_type):
+                    errors.append(f"{key}.{field} must be a string")
+        elif not isinstance(value, expected) or not value.strip():
+            errors.append(f"{key} must be a non-empty string")
+    return errors
+
+
+def json_to_sections(data: dict) -> dict:
+    """Render schema-valid members as the usual section texts.
+
+    Members that are missing or malformed are skipped, so this also works
+    on the members of an incomplete stream.
+    """
+    sections = {}
+    explanation = data.get("explanation")
+    if isinstance(explanation, str) and explanation.strip():
+        sections["explanation"] = explanation.strip()
+    for key in SECTION_KEYS[1:]:
+        solution = data.get(key)
+        if not isinstance(solution, dict):
+            continue
+        description = solution.get("description")
+        code = solution.get("code")
+        if not isinstance(description, str) or not isinstance(code, str):
+            continue
+        text = description.strip()
+        if code.strip():
+            text += f"\n\n```python\n{code.strip()}\n```"
+        sections[key] = text
+    return sections
+
+
+_JSON_STRING_STOP = re.compile(r'["\\]')
+_JSON_NESTED_STOP = re.compile(r'["{}\[\]]')
+_JSON_OPEN_RUN = re.compile(r"[{\[]+")
+_JSON_DECODER = json.JSONDecoder()
+_JSON_VALUE_FOLLOW = frozenset(" \t\r\n,:}")
+
+
+class JsonSectionStream:
+    """Incremental parser for the top-level members of a streamed JSON object.
+
+    Text is scanned once, character by character, tracking string and
+    nesting state. Each top-level member is decoded as soon as its value
+    closes, so finished sections are available before the stream ends.
+    Anything before the opening brace (e.g. a code fence) is ignored, and
+    so is text past ``MAX_RESPONSE_CHARS``, as in ``parse_json_response``.
+    """
+
+    def __init__(self):
+        self.members = {}
+        self.complete = False
+        self.parse_seconds = 0.0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect = "key"
+        self._capture = None  # "key", "value" or "scalar" while capturing
+        self._parts = []
+        self._key = None
+        self._fed = 0
+
+    def feed(self, chunk: str) -> list:
+        """Consume more text; returns keys of members completed by it"""
+        start = time.perf_counter()
+        completed = []
+        chunk = chunk[: max(0, Config.MAX_RESPONSE_CHARS - self._fed)]
+        self._fed += len(chunk)
+        capture_from = 0 if self._capture else None
+        i = 0
+        end = len(chunk)
+
+        while i < end and not self.complete:
+            if self._depth == 0:
+                i = chunk.find("{", i)
+                if i < 0:
+                    break
+                self._depth = 1
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                # Jump straight to the next quote or backslash
+                stop = _JSON_STRING_STOP.search(chunk, i)
+                if stop is None:
+                    break
+                i = stop.start()
+                if chunk[i] == "\\":
+                    # Skip the escaped character too, unless the chunk ends here
+                    if i + 1 < end:
+                        i += 2
+                        continue
+                    self._escape = True
+                else:
+                    self._in_string = False
+                    if self._depth == 1 and self._capture in ("key", "value"):
+                        self._parts.append(chunk[capture_from : i + 1])
+                        capture_from = None
+                        self._finish(completed)
+                i += 1
+                continue
+
+            ch = chunk[i]
+            if self._depth > 1 and ch not in '"{}[]':
+                # Inside a nested value only strings and brackets matter
+                stop = _JSON_NESTED_STOP.search(chunk, i)
+                if stop is None:
+                    break
+                i = stop.start()
+                ch = chunk[i]
+            if self._depth > 1 and ch in "{[":
+                run = _JSON_OPEN_RUN.match(chunk, i)
+                self._depth += run.end() - i
+                i = run.end()
+                continue
+            elif self._depth == 1 and self._capture is None and ch not in " \t\r\n:,}":
+                # A key or value that lies wholly inside this chunk is decoded
+                # in one C-level call; otherwise it is scanned below
+                item = self._decode_whole(chunk, i)
+                if item is not None:
+                    value, i = item
+                    self._store(self._expect, value, completed)
+                    continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._capture is None:
+                    self._capture = "key" if self._expect == "key" else "value"
+                    capture_from = i
+            elif ch in "{[":
+                if self._depth == 1 and self._capture is None:
+                    self._capture = "value"
+                    capture_from = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._capture == "value":
+                    self._parts.append(chunk[capture_from : i + 1])
+                    capture_from = None
+                    self._finish(completed)
+                elif self._depth == 0:
+                    if self._capture == "scalar":
+                        self._parts.append(chunk[capture_from:i])
+                        capture_from = None
+                        self._finish(completed)
+                    self.complete = True
+            elif ch == ":":
+                self._expect = "value"
+            elif ch == ",":
+                if self._capture == "scalar":
+                    self._parts.append(chunk[capture_from:i])
+                    capture_from = None
+                    self._finish(completed)
+                self._expect = "key"
+            elif not ch.isspace() and self._capture is None and self._expect == "value":
+                self._capture = "scalar"
+                capture_from = i
+            i += 1
+
+        if capture_from is not None and self._capture:
+            self._parts.append(chunk[capture_from:])
+        self.parse_seconds += time.perf_counter() - start
+        return completed
+
+    def _decode_whole(self, chunk: str, i: int):
+        """(value, end) if a complete JSON value followed by more text starts at i"""
+        try:
+            value, end = _JSON_DECODER.raw_decode(chunk, i)
+        except (ValueError, RecursionError):
+            return None
+        # A number cut by the chunk boundary would decode as a shorter one
+        if end >= len(chunk) or chunk[end] not in _JSON_VALUE_FOLLOW:
+            return None
+        return value, end
+
+    def _store(self, kind: str, value, completed: list):
+        if kind == "key":
+            self._key = value if isinstance(value, str) else None
+        elif self._key is not None:
+            self.members[self._key] = value
+            completed.append(self._key)
+            self._key = None
+
+    def _finish(self, completed: list):
+        text = "".join(self._parts)
+        kind = self._capture
+        self._parts = []
+        self._capture = None
+        if kind == "key" and "\\" not in text:
+            self._key = text[1:-1]
+            return
+        try:
+            value = json.loads(text)
+        except (ValueError, RecursionError):
+            return
+        self._store("value" if kind == "scalar" else kind, value, completed)
+
+
+class ParseMetrics:
+    """Thread-safe latency and failure counters per parsing mode"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes = {}
+
+    def record(self, mode: str, seconds: float, ok: bool):
+        with self._lock:
+            stats = self._modes.setdefault(
+                mode, {"parses": 0, "failures": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            )
+            stats["parses"] += 1
+            stats["failures"] += 0 if ok else 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                mode: {
+                    "parses": stats["parses"],
+                    "failures": stats["failures"],
+                    "failure_rate": round(stats["failures"] / stats["parses"], 4),
+                    "mean_ms": round(stats["total_seconds"] * 1000 / stats["parses"], 3),
+                    "max_ms": round(stats["max_seconds"] * 1000, 3),
+                }
+                for mode, stats in self._modes.items()
+            }
+
+
+PARSE_METRICS = ParseMetrics()
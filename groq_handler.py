@@ -1,33 +1,126 @@
-import groq
 from config import Config
-from utils.formatters import OutputFormatter
+from llm_backends import StreamCancel, create_backend
+from patches import PatchError, apply_unified_diff, check_syntax
+from profiler import redact_secrets, sandbox_env
+from utils.formatters import JsonSectionStream, OutputFormatter, json_to_sections
+import re
 import subprocess
+import sys
 import tempfile
+import threading
+import time
 import os
 
 
+# How long a cancelled stream may take to wind down in its consumer thread
+STREAM_CLOSE_GRACE_SECONDS = 1.0
+# "SOLUTION 2:" line that starts each part of a combined patch repair reply
+_REPAIR_HEADER = re.compile(
+    r"^[^\w\n]*SOLUTION\s+([123])\b[^\n]*$", re.MULTILINE | re.IGNORECASE
+)
+
+SYSTEM_PROMPT = "You are an expert Python developer. You MUST provide exactly three different solutions for every bug: 1) Simple fix, 2) Try-except handling, 3) Alternative approach. Always follow the exact format specified."
+
+
 class GroqBugFixer:
-    def __init__(self):
-        self.client = groq.Client(api_key=Config.GROQ_API_KEY)
-        self.model = Config.MODEL_NAME
+    def __init__(self, backend=None):
+        self.backend = backend or create_backend()
+        self.model = self.backend.model
         self.formatter = OutputFormatter()
 
     def generate_fixes(self, code: str, error: str, analysis: dict) -> dict:
         """Generate three different fixes using Groq API"""
+        return self.run_analysis(code, error, analysis)["sections"]
+
+    def run_analysis(
+        self, code: str, error: str, analysis: dict, deadline=None, session=None
+    ) -> dict:
+        """Generate fixes and return them with the prompt, raw response and usage.
+
+        With a deadline the response is streamed; if it is not finished in
+        time the call is cancelled and the run is marked as timed out, with
+        whatever sections arrived in ``partial_sections``. With an
+        ``AnalysisSession`` a resubmission is sent as a follow-up turn of the
+        previous conversation and the run carries the session's turn metrics;
+        the caller must hold ``session.lock`` for the call.
+        """
+        run = {
+            "model": self.model,
+            "prompt": "",
+            "raw_response": "",
+            "latency": 0.0,
+            "prompt_tokens": None,
+            "completion_tokens": None,
+            "success": False,
+            "timed_out": False,
+            "error": None,
+            "partial_sections": {},
+            "session": None,
+        }
+        json_mode = analysis.get("output_mode") == "json"
+        start = time.perf_counter()
         try:
-            prompt = self._create_enhanced_prompt(code, error, analysis)
-            response = self._call_groq_api(prompt)
-            return self.formatter.parse_ai_response(response)
+            run["prompt"] = self._create_enhanced_prompt(code, error, analysis)
+            earlier_messages = ()
+            if session is not None:
+                plan = session.plan_turn(
+                    code, error, analysis, run["prompt"], self.backend.estimate_tokens
+                )
+                run["prompt"] = plan["prompt"]
+                earlier_messages = plan["messages"]
+            messages = self._build_messages(run["prompt"], earlier_messages)
+
+            json_stream = None
+            if deadline is None:
+                response = self._call_groq_api_raw(run["prompt"], json_mode, messages)
+            else:
+                # In JSON mode sections are decoded while the answer streams
+                json_stream = JsonSectionStream() if json_mode else None
+                response = self._call_with_deadline(
+                    run["prompt"], deadline, json_stream, messages
+                )
+            run["raw_response"] = response["text"]
+            run["prompt_tokens"] = response["prompt_tokens"]
+            run["completion_tokens"] = response["completion_tokens"]
+
+            if json_mode:
+                run["sections"] = self.formatter.parse_json_response(
+                    run["raw_response"], json_stream
+                )
+            else:
+                run["sections"] = self.formatter.parse_ai_response(
+                    run["raw_response"]
+                )
+            if response.get("timed_out"):
+                run["timed_out"] = True
+                if json_mode:
+                    run["partial_sections"] = json_to_sections(json_stream.members)
+                else:
+                    run["partial_sections"] = self.formatter.parse_partial_response(
+                        run["raw_response"]
+                    )
+            else:
+                run["success"] = True
+                if analysis.get("output_mode") == "patch":
+                    self._apply_patches(
+                        code, run, deadline, analysis.get("sandbox_validation", True)
+                    )
 
         except Exception as e:
+            run["error"] = str(e)
             error_msg = f"❌ API Error: {str(e)}"
-            return {
+            run["sections"] = {
                 "explanation": error_msg,
                 "solution1": "Please check your API key and internet connection",
                 "solution2": "Ensure the Groq API key is valid and has credits",
                 "solution3": "Try again later or use a different model",
             }
 
+        run["latency"] = time.perf_counter() - start
+        if session is not None and run["success"]:
+            run["session"] = session.record(plan, code, analysis, run)
+        return run
+
     def _create_enhanced_prompt(self, code: str, error: str, analysis: dict) -> str:
         """Create enhanced prompt with STRICT formatting requirements"""
 
@@ -44,6 +137,17 @@ class GroqBugFixer:
         prompt_parts.append("ERROR MESSAGE:")
         prompt_parts.append(error)
         prompt_parts.append("")
+        if analysis.get("profile_summary"):
+            prompt_parts.append("PERFORMANCE PROFILE (measured in a sandbox):")
+            prompt_parts.append(analysis["profile_summary"])
+            prompt_parts.append("")
+            prompt_parts.append(
+                "This is a performance problem. Every solution MUST speed up the hot path shown in the profile above and include the COMPLETE runnable program in a single ```python block."
+            )
+            prompt_parts.append("")
+        if analysis.get("output_mode") == "json":
+            self._append_json_format(prompt_parts)
+            return "\n".join(prompt_parts)
         prompt_parts.append(
             "YOUR RESPONSE MUST FOLLOW THIS EXACT FORMAT - NO DEVIATIONS:"
         )
@@ -75,35 +179,308 @@ class GroqBugFixer:
             "3. Solution 2 must include proper try-except error handling"
         )
         prompt_parts.append("4. Solution 3 must be a fundamentally different approach")
-        prompt_parts.append("5. Each solution must include actual Python code examples")
-        prompt_parts.append("6. Do NOT skip any of the three solutions")
+        if analysis.get("output_mode") == "patch":
+            prompt_parts.append(
+                "5. Each solution must give a short explanation followed by exactly ONE ```diff block: a unified diff against CODE TO ANALYZE with --- a/code.py and +++ b/code.py headers, @@ hunk headers and 3 unchanged context lines copied exactly"
+            )
+            prompt_parts.append("6. Do NOT skip any of the three solutions")
+            prompt_parts.append(
+                "7. Do NOT repeat the full code; only the diff is needed"
+            )
+        else:
+            prompt_parts.append(
+                "5. Each solution must include actual Python code examples"
+            )
+            prompt_parts.append("6. Do NOT skip any of the three solutions")
         prompt_parts.append("")
         prompt_parts.append("Now provide your analysis:")
 
         return "\n".join(prompt_parts)
 
+    def _append_json_format(self, prompt_parts: list):
+        """Format instructions for JSON output mode"""
+        prompt_parts.append(
+            "YOUR RESPONSE MUST BE A SINGLE JSON OBJECT WITH EXACTLY THIS SHAPE - NO TEXT BEFORE OR AFTER IT:"
+        )
+        prompt_parts.append("")
+        prompt_parts.append("{")
+        prompt_parts.append(
+            '  "explanation": "clear, one-paragraph explanation of what caused the error and why it happened",'
+        )
+        prompt_parts.append(
+            '  "solution1": {"description": "the SIMPLEST direct fix a beginner would understand", "code": "complete corrected Python code"},'
+        )
+        prompt_parts.append(
+            '  "solution2": {"description": "ROBUST try-except handling with specific exception types", "code": "complete corrected Python code"},'
+        )
+        prompt_parts.append(
+            '  "solution3": {"description": "a COMPLETELY DIFFERENT approach or best practice", "code": "complete corrected Python code"}'
+        )
+        prompt_parts.append("}")
+        prompt_parts.append("")
+        prompt_parts.append("CRITICAL REQUIREMENTS:")
+        prompt_parts.append("1. All three solutions MUST be different from each other")
+        prompt_parts.append("2. Keys must appear in the order shown above")
+        prompt_parts.append(
+            "3. \"code\" holds plain Python source with newlines escaped as \\n - no Markdown fences"
+        )
+        prompt_parts.append("4. Do NOT skip any of the three solutions")
+
     def _call_groq_api(self, prompt: str) -> str:
-        """Make API call to Groq"""
+        """Make API call to the configured LLM backend"""
+        return self._call_groq_api_raw(prompt)["text"]
+
+    def _call_groq_api_raw(
+        self, prompt: str, json_mode: bool = False, messages: list = None
+    ) -> dict:
+        """Make API call and return the text with token accounting"""
+        options = self._completion_options()
+        if json_mode:
+            # Upstream JSON mode is not available while streaming, so it is
+            # only requested here; the prompt alone asks for JSON otherwise
+            options["response_format"] = {"type": "json_object"}
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert Python developer. You MUST provide exactly three different solutions for every bug: 1) Simple fix, 2) Try-except handling, 3) Alternative approach. Always follow the exact format specified.",
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0.8,  # Increased for more diverse solutions
-                max_tokens=3000,  # Increased for longer responses
-                top_p=0.9,
+            return self.backend.complete(
+                messages or self._build_messages(prompt), **options
             )
-            return response.choices[0].message.content
         except Exception as e:
             if Config.DEBUG_MODE:
-                print(f"Debug: Groq API call failed: {e}")
+                print(f"Debug: {self.backend.name} API call failed: {e}")
             raise e
 
+    def _apply_patches(self, code: str, run: dict, deadline=None, sandbox=True):
+        """Apply each solution's diff; re-request the failing ones in one call"""
+        patches = {}
+        failed = []
+        # A trimmed upload is a fragment that never parses; only syntax errors
+        # a patch introduces into parseable code count as a failure
+        syntax_check = not check_syntax(code)
+        for number, key in enumerate(("solution1", "solution2", "solution3"), start=1):
+            patches[key] = self._apply_section_patch(
+                code, run["sections"][key], sandbox, syntax_check
+            )
+            if patches[key]["error"]:
+                failed.append((number, key))
+
+        if failed and (deadline is None or not deadline.expired()):
+            if Config.DEBUG_MODE:
+                failing = ", ".join(key for _, key in failed)
+                print(f"Debug: Patches for {failing} failed, re-requesting")
+            prompt = self._create_patch_repair_prompt(
+                code,
+                [
+                    (number, run["sections"][key], patches[key]["error"])
+                    for number, key in failed
+                ],
+            )
+            try:
+                if deadline is None:
+                    repair = self._call_groq_api_raw(prompt)
+                else:
+                    repair = self._call_with_deadline(prompt, deadline)
+            except Exception as e:
+                repair = None
+                if Config.DEBUG_MODE:
+                    print(f"Debug: Patch re-request failed: {e}")
+            if repair is not None:
+                run["prompt_tokens"] = (run["prompt_tokens"] or 0) + (
+                    repair["prompt_tokens"] or 0
+                )
+                run["completion_tokens"] = (run["completion_tokens"] or 0) + (
+                    repair["completion_tokens"] or 0
+                )
+            # A reply cut off by the deadline may end inside a diff; keep the originals
+            if repair is not None and not repair.get("timed_out"):
+                replies = self._split_repair_reply(
+                    repair["text"], [number for number, _ in failed]
+                )
+                for number, key in failed:
+                    retried = self._apply_section_patch(
+                        code, replies.get(number, ""), sandbox, syntax_check
+                    )
+                    if not retried["error"]:
+                        retried["retried"] = True
+                        prose = self.formatter.remove_code_blocks(
+                            run["sections"][key], "diff"
+                        )
+                        run["sections"][key] = (
+                            f"{prose}\n\n```diff\n{retried['diff']}```"
+                        )
+                        patches[key] = retried
+        run["patches"] = patches
+
+        # Compare against three full rewrites of the file plus the same prose
+        if run["completion_tokens"]:
+            diff_tokens = sum(
+                self.backend.estimate_tokens(patch["diff"]) for patch in patches.values()
+            )
+            full_rewrite = (
+                max(0, run["completion_tokens"] - diff_tokens)
+                + 3 * self.backend.estimate_tokens(code)
+            )
+            run["patch_stats"] = {
+                "completion_tokens": run["completion_tokens"],
+                "full_rewrite_estimate": full_rewrite,
+                "reduction_percent": max(
+                    0.0, 100.0 * (1 - run["completion_tokens"] / full_rewrite)
+                ),
+            }
+
+    def _apply_section_patch(
+        self, code: str, section: str, sandbox=True, syntax_check=True
+    ) -> dict:
+        """Apply the diff in one solution and validate the patched file.
+
+        With ``sandbox`` false the patched file is only syntax-checked, and
+        with ``syntax_check`` false it is only applied.
+        """
+        patch = {
+            "diff": "",
+            "patched_code": "",
+            "error": "",
+            "syntax_checked": syntax_check,
+            "sandbox": None,
+        }
+        diffs = self.formatter.extract_code_blocks(section, "diff")
+        if not diffs:
+            patch["error"] = "no ```diff block in the answer"
+            return patch
+
+        patch["diff"] = diffs[0]
+        try:
+            patch["patched_code"] = apply_unified_diff(code, patch["diff"])
+        except PatchError as e:
+            patch["error"] = str(e)
+            return patch
+
+        if syntax_check:
+            patch["error"] = check_syntax(patch["patched_code"])
+        if (
+            not patch["error"]
+            and syntax_check
+            and sandbox
+            and Config.PATCH_SANDBOX_VALIDATION
+        ):
+            patch["sandbox"] = self.test_fix_in_sandbox(patch["patched_code"])
+        return patch
+
+    def _create_patch_repair_prompt(self, code: str, failures: list) -> str:
+        """Follow-up prompt asking for corrected diffs of all failing solutions.
+
+        ``failures`` holds (number, section, error) for each solution.
+        """
+        numbers = [number for number, _, _ in failures]
+        prompt_parts = []
+        prompt_parts.append(
+            "Some unified diffs you gave could not be applied to the code below."
+        )
+        prompt_parts.append("")
+        prompt_parts.append("CODE TO ANALYZE:")
+        prompt_parts.append("```python")
+        prompt_parts.append(code)
+        prompt_parts.append("```")
+        for number, section, error in failures:
+            prompt_parts.append("")
+            prompt_parts.append(f"YOUR PREVIOUS SOLUTION {number} (failed: {error}):")
+            prompt_parts.append(section)
+        prompt_parts.append("")
+        prompt_parts.append(
+            "For each of these solutions, reply with a line 'SOLUTION N:' followed by ONLY a corrected unified diff against the code above, in a single ```diff block. Copy context and removed lines exactly from the code."
+        )
+        prompt_parts.append(
+            "Reply for: " + ", ".join(f"SOLUTION {number}" for number in numbers)
+        )
+        return "\n".join(prompt_parts)
+
+    def _split_repair_reply(self, text: str, numbers: list) -> dict:
+        """Reply text for each requested solution number, split on its header"""
+        headers = list(_REPAIR_HEADER.finditer(text))
+        if not headers:
+            # A single repair may come back without its header
+            return {numbers[0]: text} if len(numbers) == 1 else {}
+        replies = {}
+        for index, header in enumerate(headers):
+            end = headers[index + 1].start() if index + 1 < len(headers) else len(text)
+            replies.setdefault(int(header.group(1)), text[header.end() : end])
+        return replies
+
+    def _call_with_deadline(
+        self, prompt: str, deadline, json_stream=None, messages: list = None
+    ) -> dict:
+        """Stream the completion until it ends or the deadline passes.
+
+        On the deadline the upstream request is aborted from this thread
+        before returning, so the caller's admission slot is only released
+        once the call has really stopped.
+        """
+        usage = {}
+        pieces = []
+        errors = []
+        finished = threading.Event()
+        cancel = StreamCancel()
+        options = self._completion_options()
+        # Bounds the wait for the response headers, which cancel cannot abort
+        options["timeout"] = max(0.1, deadline.remaining())
+
+        def consume():
+            stream = self.backend.stream(
+                messages or self._build_messages(prompt),
+                usage=usage,
+                cancel=cancel,
+                **options,
+            )
+            try:
+                for delta in stream:
+                    if cancel.cancelled:
+                        break
+                    pieces.append(delta)
+                    if json_stream is not None:
+                        json_stream.feed(delta)
+            except Exception as e:
+                if not cancel.cancelled:
+                    errors.append(e)
+            finally:
+                stream.close()
+                finished.set()
+
+        threading.Thread(target=consume, daemon=True).start()
+        if not finished.wait(timeout=deadline.remaining()):
+            cancel.cancel()
+            finished.wait(timeout=STREAM_CLOSE_GRACE_SECONDS)
+            if Config.DEBUG_MODE:
+                print("Debug: Deadline reached, cancelled the LLM stream")
+            text = "".join(pieces)
+            return {
+                "text": text,
+                "prompt_tokens": None,
+                "completion_tokens": self.backend.estimate_tokens(text),
+                "timed_out": True,
+            }
+
+        if errors:
+            raise errors[0]
+        return {
+            "text": "".join(pieces),
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "timed_out": False,
+        }
+
+    def _build_messages(self, prompt: str, earlier_messages=()) -> list:
+        """System prompt first so that every request shares the same prefix"""
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            *earlier_messages,
+            {"role": "user", "content": prompt},
+        ]
+
+    def _completion_options(self) -> dict:
+        return {
+            "temperature": 0.8,  # Increased for more diverse solutions
+            "max_tokens": 3000,  # Increased for longer responses
+            "top_p": 0.9,
+        }
+
     def test_fix_in_sandbox(self, fixed_code: str) -> dict:
         """Optionally test AI-suggested fix in a sandboxed subprocess"""
         result = {"success": False, "output": "", "error": ""}
@@ -115,21 +492,23 @@ class GroqBugFixer:
                 tmp_file.write(fixed_code)
                 tmp_path = tmp_file.name
 
+            # Isolated mode and a minimal environment keep server secrets out
             process = subprocess.run(
-                ["python", tmp_path],
+                [sys.executable, "-I", tmp_path],
                 capture_output=True,
                 text=True,
                 timeout=5,
+                env=sandbox_env(),
             )
 
-            result["output"] = process.stdout.strip()
-            result["error"] = process.stderr.strip()
+            result["output"] = redact_secrets(process.stdout.strip())
+            result["error"] = redact_secrets(process.stderr.strip())
             result["success"] = process.returncode == 0
 
         except subprocess.TimeoutExpired:
             result["error"] = "Execution timed out (possible infinite loop)"
         except Exception as e:
-            result["error"] = f"Sandbox error: {e}"
+            result["error"] = redact_secrets(f"Sandbox error: {e}")
 
         finally:
             try:
@@ -0,0 +1,309 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from config import Config
+
+# Shared preset dictionary for zlib. Prompts, tracebacks and model answers
+# repeat the same boilerplate, so seeding the compressor with it lets even
+# short records compress well. Never edit this in place: add a new codec
+# id with a new dictionary so old records stay readable.
+_ZDICT_V1 = "\n".join(
+    [
+        "IMPORTANT: You MUST provide EXACTLY THREE different solutions in the specified format below. Each solution must be genuinely different.",
+        "CODE TO ANALYZE:",
+        "ERROR MESSAGE:",
+        "YOUR RESPONSE MUST FOLLOW THIS EXACT FORMAT - NO DEVIATIONS:",
+        "ERROR EXPLANATION:",
+        "SOLUTION 1 (SIMPLE FIX):",
+        "SOLUTION 2 (TRY-EXCEPT HANDLING):",
+        "SOLUTION 3 (ALTERNATIVE APPROACH):",
+        "CRITICAL REQUIREMENTS:",
+        "Traceback (most recent call last):",
+        '  File "', '", line ', ", in <module>",
+        "TypeError: ValueError: KeyError: IndexError: AttributeError: NameError: ZeroDivisionError: FileNotFoundError: ImportError: ModuleNotFoundError:",
+        "```python\n", "```\n",
+        "def ", "return ", "import ", "from ", "class ", "self.", "try:\n", "except ", " as e:\n", "print(f\"", "if __name__ == \"__main__\":",
+        '{"explanation": "', '", "solution1": "', '", "solution2": "', '", "solution3": "',
+    ]
+).encode("utf-8")
+
+_CODEC_RAW = 0
+_CODEC_ZLIB_V1 = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    owner_id TEXT,
+    signature TEXT NOT NULL,
+    context_hash TEXT NOT NULL,
+    error_type TEXT,
+    model TEXT,
+    latency_ms INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    context BLOB,
+    prompt BLOB,
+    raw_response BLOB,
+    sections BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_signature ON analyses (signature, created_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_created_at ON analyses (created_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_context_hash ON analyses (context_hash);
+"""
+
+# Applied after _SCHEMA, so that tables created before a column existed get it
+_MIGRATIONS = (
+    ("owner_id", "ALTER TABLE analyses ADD COLUMN owner_id TEXT"),
+)
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_analyses_owner ON analyses (owner_id, created_at);
+"""
+
+_SUMMARY_COLUMNS = (
+    "id, created_at, signature, error_type, model, "
+    "latency_ms, prompt_tokens, completion_tokens"
+)
+
+
+def _compress(text: str) -> bytes:
+    """Compress a text field with the shared zlib dictionary"""
+    data = (text or "").encode("utf-8")
+    if len(data) < 64:
+        return bytes([_CODEC_RAW]) + data
+    compressor = zlib.compressobj(level=6, zdict=_ZDICT_V1)
+    return bytes([_CODEC_ZLIB_V1]) + compressor.compress(data) + compressor.flush()
+
+
+def _decompress(blob: bytes) -> str:
+    """Inverse of _compress"""
+    if not blob:
+        return ""
+    codec, payload = blob[0], blob[1:]
+    if codec == _CODEC_RAW:
+        return payload.decode("utf-8")
+    if codec == _CODEC_ZLIB_V1:
+        decompressor = zlib.decompressobj(zdict=_ZDICT_V1)
+        return (decompressor.decompress(payload) + decompressor.flush()).decode(
+            "utf-8"
+        )
+    raise ValueError(f"Unknown history codec: {codec}")
+
+
+def _owner_clause(owner_id: str) -> tuple:
+    """WHERE fragment and parameters limiting a query to one owner's records"""
+    if owner_id is None:
+        return "", ()
+    return " AND owner_id = ?", (owner_id,)
+
+
+def error_signature(error_details: dict) -> str:
+    """Stable signature for an error, ignoring volatile values in the message"""
+    message = error_details.get("error_message") or ""
+    # Drop quoted literals, addresses and numbers so that e.g. two KeyErrors
+    # on different keys share a signature
+    message = re.sub(r"'[^']{0,200}'|\"[^\"]{0,200}\"", "<str>", message)
+    message = re.sub(r"0x[0-9a-fA-F]+", "<addr>", message)
+    message = re.sub(r"\d+", "<n>", message)
+    key = f"{error_details.get('error_type') or 'UnknownError'}|{message.strip()}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def context_hash(
+    code: str,
+    error_traceback: str,
+    output_mode: str = "text",
+    performance_mode: bool = False,
+) -> str:
+    """Hash of the exact (code, traceback) pair submitted by the user.
+
+    The output and performance modes are part of the key: the same pair
+    answered as diffs or with profiling is a different analysis.
+    """
+    digest = hashlib.sha256()
+    digest.update(code.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(error_traceback.encode("utf-8"))
+    digest.update(f"\0{output_mode}\0{int(bool(performance_mode))}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AnalysisHistory:
+    """Append-only, compressed store of past analyses backed by SQLite"""
+
+    def __init__(self, path: str = None):
+        self.path = path or Config.HISTORY_DB_PATH
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Keep the page cache small and fixed so memory does not grow with the table
+        self._conn.execute("PRAGMA cache_size=-8192")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(analyses)")}
+        for column, statement in _MIGRATIONS:
+            if column not in columns:
+                self._conn.execute(statement)
+        self._conn.executescript(_INDEXES)
+        self._conn.commit()
+
+    def record(
+        self,
+        code: str,
+        error_traceback: str,
+        analysis: dict,
+        run: dict,
+        owner_id: str = None,
+    ) -> int:
+        """Append one analysis and return its id.
+
+        Records carry an ``owner_id``, a token unique to the submitting
+        browser session; lookups can be limited to it because the stored
+        fixes contain that user's code. Records without one are never
+        returned by an owner-limited lookup.
+        """
+        error_details = analysis.get("error_details", {})
+        output_mode = analysis.get("output_mode", "text")
+        performance_mode = bool(analysis.get("performance_mode"))
+        context = json.dumps(
+            {
+                "code": code,
+                "error_traceback": error_traceback,
+                "enhanced_context": analysis.get("enhanced_context", ""),
+                "output_mode": output_mode,
+                "performance_mode": performance_mode,
+            }
+        )
+        row = (
+            time.time(),
+            owner_id,
+            error_signature(error_details),
+            context_hash(code, error_traceback, output_mode, performance_mode),
+            error_details.get("error_type"),
+            run.get("model"),
+            int(run.get("latency", 0) * 1000),
+            run.get("prompt_tokens"),
+            run.get("completion_tokens"),
+            _compress(context),
+            _compress(run.get("prompt", "")),
+            _compress(run.get("raw_response", "")),
+            _compress(json.dumps(run.get("sections", {}))),
+        )
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO analyses (created_at, owner_id, signature, "
+                "context_hash, error_type, model, latency_ms, prompt_tokens, "
+                "completion_tokens, context, prompt, raw_response, sections) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def get(self, record_id: int, owner_id: str = None) -> dict:
+        """Load a full record, or None if it does not exist (or, with an
+        ``owner_id``, belongs to another owner)"""
+        where, params = _owner_clause(owner_id)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_SUMMARY_COLUMNS}, context, prompt, raw_response, sections "
+                f"FROM analyses WHERE id = ?{where}",
+                (record_id, *params),
+            ).fetchone()
+        if row is None:
+            return None
+        record = self._summary(row[:8])
+        context = json.loads(_decompress(row[8]))
+        record.update(context)
+        record["prompt"] = _decompress(row[9])
+        record["raw_response"] = _decompress(row[10])
+        record["sections"] = json.loads(_decompress(row[11]))
+        return record
+
+    def find_exact(
+        self,
+        code: str,
+        error_traceback: str,
+        output_mode: str = "text",
+        performance_mode: bool = False,
+        owner_id: str = None,
+    ) -> dict:
+        """Most recent analysis of the exact same (code, traceback) in the same modes"""
+        key = context_hash(code, error_traceback, output_mode, performance_mode)
+        where, params = _owner_clause(owner_id)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT id FROM analyses WHERE context_hash = ?{where} "
+                "ORDER BY id DESC LIMIT 1",
+                (key, *params),
+            ).fetchone()
+        return self.get(row[0]) if row else None
+
+    def find_by_signature(
+        self, signature: str, limit: int = 10, owner_id: str = None
+    ) -> list:
+        """Summaries of the latest analyses sharing an error signature"""
+        where, params = _owner_clause(owner_id)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_SUMMARY_COLUMNS} FROM analyses WHERE signature = ?{where} "
+                "ORDER BY created_at DESC LIMIT ?",
+                (signature, *params, limit),
+            ).fetchall()
+        return [self._summary(row) for row in rows]
+
+    def recent(
+        self, limit: int = 20, since: float = None, owner_id: str = None
+    ) -> list:
+        """Summaries of the latest analyses, optionally newer than `since`"""
+        where, params = _owner_clause(owner_id)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_SUMMARY_COLUMNS} FROM analyses WHERE created_at >= ?{where} "
+                "ORDER BY created_at DESC LIMIT ?",
+                (since or 0, *params, limit),
+            ).fetchall()
+        return [self._summary(row) for row in rows]
+
+    def iter_range(self, start: float, end: float, batch_size: int = 1000):
+        """Yield summaries between two timestamps in bounded-size batches.
+
+        Pages on (created_at, id), the order of the created_at index (which
+        carries the rowid), so each batch is an index seek with no sort.
+        """
+        last = (start, 0)
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {_SUMMARY_COLUMNS} FROM analyses "
+                    "WHERE (created_at, id) > (?, ?) AND created_at < ? "
+                    "ORDER BY created_at, id LIMIT ?",
+                    (*last, end, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._summary(row)
+            last = (rows[-1][1], rows[-1][0])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _summary(row) -> dict:
+        return {
+            "id": row[0],
+            "created_at": row[1],
+            "signature": row[2],
+            "error_type": row[3],
+            "model": row[4],
+            "latency_ms": row[5],
+            "prompt_tokens": row[6],
+            "completion_tokens": row[7],
+        }
@@ -0,0 +1,254 @@
+import mmap
+import os
+import re
+from config import Config
+
+TRACEBACK_HEADER = "Traceback (most recent call last):"
+CHAIN_MARKERS = (
+    "During handling of the above exception, another exception occurred:",
+    "The above exception was the direct cause of the following exception:",
+)
+
+# Most tracebacks of one exception chain kept from the end of a log
+MAX_CHAIN_LENGTH = 8
+# How far above a traceback header a chain marker may appear
+CHAIN_MARKER_WINDOW = 1024
+# Size of the blocks an uploaded code file is read in
+READ_BLOCK_SIZE = 1024 * 1024
+
+_FRAME = re.compile(r'(File "([^"\n]{1,1024})", line )(\d{1,9})')
+_DIGITS = re.compile(r"\d")
+
+
+def final_traceback(buffer) -> str:
+    """The last exception chain in a log, found by scanning back from its end.
+
+    ``buffer`` is a str, bytes or a read-only mmap; only the slice holding
+    the chain (at most ``MAX_TRACEBACK_CHARS``) is copied and decoded.
+    A constant-width prefix on every line, such as a CI timestamp, is
+    removed. Without any traceback header the tail of the log is returned.
+    """
+    as_text = isinstance(buffer, str)
+
+    def encode(text):
+        return text if as_text else text.encode()
+
+    newline = encode("\n")
+    limit = Config.MAX_TRACEBACK_CHARS
+    header = encode(TRACEBACK_HEADER)
+    markers = [encode(marker) for marker in CHAIN_MARKERS]
+
+    header_at = buffer.rfind(header)
+    if header_at == -1:
+        block_start = max(0, len(buffer) - limit)
+        if block_start and buffer.find(newline, block_start) != -1:
+            block_start = buffer.find(newline, block_start) + 1
+        return _decode(buffer[block_start:]).strip()
+
+    line_start = buffer.rfind(newline, 0, header_at) + 1
+    prefix_width = header_at - line_start
+    block_end = _exception_line_end(buffer, header_at, prefix_width, limit, as_text)
+
+    # Earlier tracebacks of the same chain end just above a chain marker
+    block_start = line_start
+    for _ in range(MAX_CHAIN_LENGTH - 1):
+        above = buffer[max(0, block_start - CHAIN_MARKER_WINDOW) : block_start]
+        if not any(marker in above for marker in markers):
+            break
+        previous = buffer.rfind(header, max(0, block_end - limit), block_start)
+        if previous == -1:
+            break
+        block_start = buffer.rfind(newline, 0, previous) + 1
+
+    text = _decode(buffer[block_start:block_end])
+    if prefix_width:
+        text = _strip_prefix(text, _decode(buffer[line_start:header_at]))
+    return text.strip()
+
+
+def read_traceback_file(path: str) -> str:
+    """Final exception chain of a log file, without reading the whole file"""
+    with open(path, "rb") as log_file:
+        try:
+            with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return final_traceback(buffer)
+        except (ValueError, OSError):
+            # Empty or unmappable file: scan a bounded tail instead
+            log_file.seek(0, os.SEEK_END)
+            size = log_file.tell()
+            log_file.seek(max(0, size - 4 * Config.MAX_TRACEBACK_CHARS))
+            return final_traceback(log_file.read())
+
+
+def read_code_file(path: str, traceback: str) -> dict:
+    """Source of an uploaded file, trimmed to the regions the traceback uses.
+
+    Files up to ``MAX_UPLOAD_CODE_CHARS`` are returned whole. Larger files
+    are read in fixed-size blocks and only the lines around frames in this
+    file are kept, with a comment marking each omitted range. Frame line
+    numbers in the returned traceback are rewritten to match the trimmed
+    code, so context extraction and patches line up with it. ``trimmed``
+    tells whether the code was cut and so no longer runs on its own.
+    """
+    name = os.path.basename(path)
+    result = {"code": "", "traceback": traceback, "note": "", "trimmed": False}
+
+    if os.path.getsize(path) <= Config.MAX_UPLOAD_CODE_CHARS:
+        with open(path, encoding="utf-8", errors="replace") as code_file:
+            result["code"] = code_file.read()
+        return result
+
+    frame_file = _code_frame_file(traceback, name)
+    wanted = sorted(
+        {
+            int(match.group(3))
+            for match in _FRAME.finditer(traceback)
+            if match.group(2) == frame_file
+        }
+    )
+    context = Config.UPLOAD_CONTEXT_LINES
+    regions = []
+    for number in wanted or [1]:
+        start, end = max(1, number - context), number + context
+        if regions and start <= regions[-1][1] + 1:
+            regions[-1][1] = max(regions[-1][1], end)
+        else:
+            regions.append([start, end])
+
+    with open(path, "rb") as code_file:
+        lines, total_lines = _read_regions(code_file, regions)
+
+    kept = []
+    line_map = {}
+    previous = 0
+    for number in sorted(lines):
+        if number > previous + 1:
+            kept.append(f"# ... lines {previous + 1}-{number - 1} omitted ...")
+        kept.append(lines[number])
+        line_map[number] = len(kept)
+        previous = number
+    if total_lines > previous:
+        kept.append(f"# ... lines {previous + 1}-{total_lines} omitted ...")
+
+    def renumber(match):
+        number = int(match.group(3))
+        if match.group(2) != frame_file or number not in line_map:
+            return match.group(0)
+        return f"{match.group(1)}{line_map[number]}"
+
+    result["code"] = "\n".join(kept)
+    result["trimmed"] = True
+    result["traceback"] = _FRAME.sub(renumber, traceback)
+    result["note"] = (
+        f"`{name}` is large: kept {len(line_map)} of {total_lines} lines around "
+        f"the traceback frames; line numbers below refer to the trimmed code."
+    )
+    if Config.DEBUG_MODE:
+        print(f"Debug: Trimmed {name} to {len(line_map)} of {total_lines} lines")
+    return result
+
+
+def _exception_line_end(buffer, header_at, prefix_width, limit, as_text) -> int:
+    """End offset of the exception line that closes the traceback at header_at"""
+    newline = "\n" if as_text else b"\n"
+    # Frames and source lines are indented; blank CRLF lines start with "\r"
+    continued = (" ", "\t", "\r") if as_text else (b" ", b"\t", b"\r")
+    stop = min(len(buffer), header_at + limit)
+
+    position = buffer.find(newline, header_at, stop)
+    while position != -1:
+        body_at = position + 1 + prefix_width
+        line_end = buffer.find(newline, position + 1, stop)
+        if line_end == -1:
+            line_end = stop
+        if body_at < line_end and buffer[body_at : body_at + 1] not in continued:
+            # First unindented line after the frames is "Name: message"
+            return line_end
+        if line_end == stop:
+            break
+        position = line_end
+    return stop
+
+
+def _strip_prefix(text: str, prefix: str) -> str:
+    """Drop a prefix like the header's from every line, if all lines carry one.
+
+    Digits may differ between lines, so per-line timestamps are recognised.
+    """
+    width = len(prefix)
+    shape = _DIGITS.sub("0", prefix)
+    lines = text.split("\n")
+    if all(not line or _DIGITS.sub("0", line[:width]) == shape for line in lines):
+        return "\n".join(line[width:] for line in lines)
+    return text
+
+
+def _code_frame_file(traceback: str, name: str):
+    """File name the traceback uses for the uploaded code.
+
+    Frames whose base name matches the upload win; otherwise the first
+    frame's file, as in ``extract_error_details``.
+    """
+    first = None
+    for match in _FRAME.finditer(traceback):
+        frame_file = match.group(2)
+        if os.path.basename(frame_file.replace("\\", "/")) == name:
+            return frame_file
+        if first is None:
+            first = frame_file
+    return first
+
+
+def _read_regions(binary_file, regions: list) -> tuple:
+    """Lines inside the [start, end] regions, plus the file's line count.
+
+    The file is read in fixed-size blocks; blocks without a wanted line are
+    only counted. Kept lines are cut to ``MAX_LINE_CHARS`` bytes and stop
+    once ``MAX_UPLOAD_CODE_CHARS`` have been collected.
+    """
+    limit = Config.MAX_LINE_CHARS
+    lines = {}
+    kept_chars = 0
+    line_number = 1  # line that the next block continues
+    pending = b""
+    region_index = 0
+    last_byte = b"\n"
+
+    for block in iter(lambda: binary_file.read(READ_BLOCK_SIZE), b""):
+        newlines = block.count(b"\n")
+        last_byte = block[-1:]
+        while region_index < len(regions) and regions[region_index][1] < line_number:
+            region_index += 1
+        if (
+            region_index == len(regions)
+            or regions[region_index][0] > line_number + newlines
+            or kept_chars >= Config.MAX_UPLOAD_CODE_CHARS
+        ):
+            line_number += newlines
+            continue
+
+        parts = block.split(b"\n")
+        for offset, part in enumerate(parts):
+            number = line_number + offset
+            while region_index < len(regions) and regions[region_index][1] < number:
+                region_index += 1
+            if region_index == len(regions) or regions[region_index][0] > number:
+                continue
+            if len(pending) < limit:
+                pending += part[: limit - len(pending)]
+            if offset < len(parts) - 1:
+                if kept_chars < Config.MAX_UPLOAD_CODE_CHARS:
+                    lines[number] = pending.rstrip(b"\r").decode("utf-8", errors="replace")
+                    kept_chars += len(lines[number]) + 1
+                pending = b""
+        line_number += newlines
+
+    # A final line without a trailing newline
+    total_lines = line_number if last_byte != b"\n" else line_number - 1
+    if pending and total_lines not in lines:
+        lines[total_lines] = pending.rstrip(b"\r").decode("utf-8", errors="replace")
+    return lines, total_lines
+
+
+def _decode(data) -> str:
+    return data if isinstance(data, str) else data.decode("utf-8", errors="replace")
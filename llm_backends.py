@@ -0,0 +1,372 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from config import Config
+
+
+class StreamCancel:
+    """Cancels a running stream from another thread.
+
+    Backends register a callback that aborts the upstream request, e.g. by
+    closing its HTTP response, so a blocked read returns at once instead
+    of after the next token arrives.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.cancelled = False
+
+    def on_cancel(self, callback):
+        """Run callback when cancelled; at once if that already happened"""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                if Config.DEBUG_MODE:
+                    print(f"Debug: Stream cancel callback failed: {e}")
+
+
+class LLMBackend:
+    """Common interface for chat-completion backends.
+
+    ``complete`` returns a dict with ``text``, ``model``, ``prompt_tokens``,
+    ``completion_tokens`` and ``latency``. ``stream`` yields text deltas and,
+    if given a ``usage`` dict, fills it with the same accounting keys once
+    the stream ends; a ``StreamCancel`` passed as ``cancel`` aborts it from
+    any thread. Every call is added to the throughput counters.
+    """
+
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "failures": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "busy_seconds": 0.0,
+        }
+
+    def complete(self, messages: list, **options) -> dict:
+        raise NotImplementedError
+
+    def stream(self, messages: list, usage: dict = None, cancel=None, **options):
+        raise NotImplementedError
+
+    async def acomplete(self, messages: list, **options) -> dict:
+        """Async completion; backends without a native async client use a thread"""
+        return await asyncio.to_thread(self.complete, messages, **options)
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Rough token count for backends that do not report usage"""
+        return max(1, len(text) // 4)
+
+    def throughput(self) -> dict:
+        """Accumulated usage and completion tokens per second of backend time"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        busy = stats["busy_seconds"]
+        stats["backend"] = self.name
+        stats["model"] = self.model
+        stats["completion_tokens_per_second"] = (
+            round(stats["completion_tokens"] / busy, 1) if busy else 0.0
+        )
+        stats["requests_per_minute"] = (
+            round(stats["requests"] * 60 / busy, 1) if busy else 0.0
+        )
+        return stats
+
+    def _record(self, result: dict = None, failed: bool = False):
+        with self._stats_lock:
+            if failed:
+                self._stats["failures"] += 1
+                return
+            self._stats["requests"] += 1
+            self._stats["prompt_tokens"] += result["prompt_tokens"] or 0
+            self._stats["completion_tokens"] += result["completion_tokens"] or 0
+            self._stats["busy_seconds"] += result["latency"]
+
+    def _prompt_text(self, messages: list) -> str:
+        return "\n".join(message["content"] for message in messages)
+
+
+class GroqBackend(LLMBackend):
+    """Groq cloud API"""
+
+    name = "groq"
+
+    def __init__(self, model: str = None, api_key: str = None):
+        import groq
+
+        super().__init__(model or Config.MODEL_NAME)
+        api_key = api_key or Config.GROQ_API_KEY
+        self.client = groq.Client(api_key=api_key)
+        self.async_client = groq.AsyncClient(api_key=api_key)
+
+    def complete(self, messages: list, **options) -> dict:
+        start = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model, messages=messages, **options
+            )
+        except Exception:
+            self._record(failed=True)
+            raise
+        result = self._result(response, time.perf_counter() - start)
+        self._record(result)
+        return result
+
+    async def acomplete(self, messages: list, **options) -> dict:
+        start = time.perf_counter()
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model, messages=messages, **options
+            )
+        except Exception:
+            self._record(failed=True)
+            raise
+        result = self._result(response, time.perf_counter() - start)
+        self._record(result)
+        return result
+
+    def stream(self, messages: list, usage: dict = None, cancel=None, **options):
+        start = time.perf_counter()
+        pieces = []
+        reported = None
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model, messages=messages, stream=True, **options
+            )
+        except Exception:
+            self._record(failed=True)
+            raise
+        if cancel is not None:
+            # Closing the HTTP response from the cancelling thread aborts a
+            # read that is blocked waiting for the next chunk
+            http_response = getattr(response, "response", response)
+            cancel.on_cancel(http_response.close)
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    pieces.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+                # Groq reports usage on the final chunk
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None and getattr(x_groq, "usage", None):
+                    reported = x_groq.usage
+        finally:
+            # Closing the response stops the upstream generation early when
+            # the consumer abandons the stream
+            close = getattr(response, "close", None)
+            if close is not None:
+                close()
+            text = "".join(pieces)
+            result = {
+                "text": text,
+                "model": self.model,
+                "prompt_tokens": (
+                    reported.prompt_tokens
+                    if reported
+                    else self.estimate_tokens(self._prompt_text(messages))
+                ),
+                "completion_tokens": (
+                    reported.completion_tokens
+                    if reported
+                    else self.estimate_tokens(text)
+                ),
+                "latency": time.perf_counter() - start,
+            }
+            self._record(result)
+            if usage is not None:
+                usage.update(result)
+
+    def _result(self, response, latency: float) -> dict:
+        usage = getattr(response, "usage", None)
+        return {
+            "text": response.choices[0].message.content,
+            "model": self.model,
+            "prompt_tokens": usage.prompt_tokens if usage else None,
+            "completion_tokens": usage.completion_tokens if usage else None,
+            "latency": latency,
+        }
+
+
+_STREAM_END = object()
+
+
+class LlamaCppBackend(LLMBackend):
+    """Local GGUF model on CPU through llama-cpp-python.
+
+    A llama.cpp model instance is not thread-safe, so all requests go
+    through a single worker thread that serves them one at a time in
+    arrival order. The RAM cache lets a request reuse the KV state of an
+    earlier one with the same prompt prefix.
+    """
+
+    name = "llamacpp"
+
+    def __init__(self, model_path: str = None):
+        try:
+            from llama_cpp import Llama, LlamaRAMCache
+        except ImportError as e:
+            raise ImportError(
+                "LLM_BACKEND=llamacpp requires llama-cpp-python: "
+                "pip install llama-cpp-python"
+            ) from e
+
+        model_path = model_path or Config.LOCAL_MODEL_PATH
+        if not model_path or not os.path.exists(model_path):
+            raise FileNotFoundError(f"Local model not found: {model_path!r}")
+
+        super().__init__(os.path.basename(model_path))
+        self.llm = Llama(
+            model_path=model_path,
+            n_ctx=Config.LOCAL_MODEL_CONTEXT,
+            n_threads=Config.LOCAL_MODEL_THREADS or None,
+            n_batch=Config.LOCAL_MODEL_BATCH_SIZE,
+            verbose=Config.DEBUG_MODE,
+        )
+        self.llm.set_cache(LlamaRAMCache())
+        self._jobs = queue.Queue()
+        self._worker = threading.Thread(target=self._run_worker, daemon=True)
+        self._worker.start()
+
+    def complete(self, messages: list, **options) -> dict:
+        job = self._submit(messages, options, streaming=False)
+        result = job["out"].get()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def stream(self, messages: list, usage: dict = None, cancel=None, **options):
+        job = self._submit(messages, options, streaming=True)
+        if cancel is not None:
+
+            def abort():
+                job["cancelled"].set()
+                job["out"].put(_STREAM_END)  # wake a consumer waiting for a delta
+
+            cancel.on_cancel(abort)
+        try:
+            while True:
+                item = job["out"].get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Lets the worker stop generating if the consumer gave up
+            job["cancelled"].set()
+        if usage is not None and job.get("result"):
+            usage.update(job["result"])
+
+    def throughput(self) -> dict:
+        stats = super().throughput()
+        stats["queue_depth"] = self._jobs.qsize()
+        return stats
+
+    def _submit(self, messages: list, options: dict, streaming: bool) -> dict:
+        job = {
+            "messages": messages,
+            "options": options,
+            "streaming": streaming,
+            "out": queue.Queue(),
+            "cancelled": threading.Event(),
+        }
+        self._jobs.put(job)
+        return job
+
+    def _run_worker(self):
+        while True:
+            job = self._jobs.get()
+            if job["cancelled"].is_set():
+                continue
+            try:
+                self._run_job(job)
+            except Exception as e:
+                self._record(failed=True)
+                job["out"].put(e)
+
+    def _run_job(self, job: dict):
+        options = {
+            key: value
+            for key, value in job["options"].items()
+            if key in ("temperature", "max_tokens", "top_p", "stop", "response_format")
+        }
+        start = time.perf_counter()
+
+        if not job["streaming"]:
+            response = self.llm.create_chat_completion(
+                messages=job["messages"], **options
+            )
+            usage = response.get("usage") or {}
+            result = {
+                "text": response["choices"][0]["message"]["content"],
+                "model": self.model,
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": usage.get("completion_tokens"),
+                "latency": time.perf_counter() - start,
+            }
+            self._record(result)
+            job["out"].put(result)
+            return
+
+        pieces = []
+        for chunk in self.llm.create_chat_completion(
+            messages=job["messages"], stream=True, **options
+        ):
+            if job["cancelled"].is_set():
+                break
+            delta = chunk["choices"][0]["delta"].get("content")
+            if delta:
+                pieces.append(delta)
+                job["out"].put(delta)
+
+        text = "".join(pieces)
+        result = {
+            "text": text,
+            "model": self.model,
+            "prompt_tokens": len(
+                self.llm.tokenize(self._prompt_text(job["messages"]).encode("utf-8"))
+            ),
+            "completion_tokens": len(self.llm.tokenize(text.encode("utf-8"))),
+            "latency": time.perf_counter() - start,
+        }
+        self._record(result)
+        job["result"] = result
+        job["out"].put(_STREAM_END)
+
+
+BACKENDS = {
+    GroqBackend.name: GroqBackend,
+    LlamaCppBackend.name: LlamaCppBackend,
+}
+
+
+def create_backend(name: str = None) -> LLMBackend:
+    """Instantiate the backend selected by LLM_BACKEND"""
+    name = (name or Config.LLM_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown LLM backend {name!r}; choose one of: {', '.join(BACKENDS)}"
+        )
+    return BACKENDS[name]()
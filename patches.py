@@ -0,0 +1,94 @@
+import ast
+import re
+
+_HUNK_HEADER = re.compile(r"@@ -(\d{1,9})(?:,(\d{1,9}))? \+(\d{1,9})(?:,(\d{1,9}))? @@")
+
+
+class PatchError(ValueError):
+    """Raised when a unified diff cannot be parsed or applied"""
+
+
+def parse_unified_diff(diff: str) -> list:
+    """Split a unified diff into hunks of (old_start, old_lines, new_lines)"""
+    hunks = []
+    current = None
+    for line in diff.split("\n"):
+        header = _HUNK_HEADER.match(line)
+        if header:
+            current = (int(header.group(1)), [], [])
+            hunks.append(current)
+            continue
+        if current is None or line.startswith(("--- ", "+++ ", "\\")):
+            continue
+        if line.startswith("+"):
+            current[2].append(line[1:])
+        elif line.startswith("-"):
+            current[1].append(line[1:])
+        else:
+            # Context line; models often drop the leading space on blank lines
+            content = line[1:] if line.startswith(" ") else line
+            current[1].append(content)
+            current[2].append(content)
+
+    # A trailing blank line after the last hunk is formatting, not context
+    for _, old_lines, new_lines in hunks:
+        while old_lines and new_lines and old_lines[-1] == new_lines[-1] == "":
+            old_lines.pop()
+            new_lines.pop()
+
+    if not hunks:
+        raise PatchError("No hunks found in the diff")
+    return hunks
+
+
+def apply_unified_diff(source: str, diff: str) -> str:
+    """Apply a unified diff to source, tolerating wrong hunk line numbers.
+
+    Each hunk is placed where its old lines match (ignoring trailing
+    whitespace), preferring the position closest to its stated line.
+    """
+    lines = source.split("\n")
+    offset = 0
+    search_from = 0
+
+    for number, (old_start, old_lines, new_lines) in enumerate(
+        parse_unified_diff(diff), start=1
+    ):
+        expected = max(search_from, old_start - 1 + offset)
+        position = _find_block(lines, old_lines, expected, search_from)
+        if position is None:
+            raise PatchError(f"Hunk {number} does not match the submitted code")
+        lines[position : position + len(old_lines)] = new_lines
+        offset += len(new_lines) - len(old_lines)
+        search_from = position + len(new_lines)
+
+    return "\n".join(lines)
+
+
+def _find_block(lines: list, block: list, expected: int, lowest: int):
+    """Index where block matches lines, nearest to expected and >= lowest"""
+    if not block:
+        return min(max(expected, lowest), len(lines))
+
+    wanted = [line.rstrip() for line in block]
+    last_start = len(lines) - len(block)
+    if last_start < lowest:
+        return None
+
+    expected = min(max(expected, lowest), last_start)
+    for distance in range(0, max(expected - lowest, last_start - expected) + 1):
+        for start in (expected - distance, expected + distance):
+            if lowest <= start <= last_start and all(
+                lines[start + i].rstrip() == wanted[i] for i in range(len(wanted))
+            ):
+                return start
+    return None
+
+
+def check_syntax(code: str) -> str:
+    """Return an error message if code does not parse, else an empty string"""
+    try:
+        ast.parse(code)
+    except SyntaxError as e:
+        return f"SyntaxError: {e.msg} (line {e.lineno})"
+    return ""
@@ -0,0 +1,350 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+from config import Config
+from utils.chunk_processor import ChunkProcessor, SourceText
+
+
+# Environment variables whose values are never shown to the user
+_SECRET_NAME = re.compile(r"KEY|TOKEN|SECRET|PASSW|CREDENTIAL|AUTH", re.IGNORECASE)
+# Groq API keys, in case one is read from a file rather than the environment
+_SECRET_PATTERN = re.compile(r"gsk_[A-Za-z0-9]{8,}")
+# Names cProfile reports for functions, comprehensions and the module body
+_FUNCTION_NAME = re.compile(r"<?[A-Za-z_][A-Za-z0-9_.]{0,99}>?")
+# Longest sandbox error text passed on to the prompt and the user
+MAX_PROFILE_ERROR_CHARS = 2000
+
+
+def sandbox_env() -> dict:
+    """Minimal environment for sandboxed user code: no inherited secrets"""
+    env = {"PATH": os.environ.get("PATH", os.defpath)}
+    if os.name == "nt" and "SYSTEMROOT" in os.environ:
+        # Python cannot start on Windows without it
+        env["SYSTEMROOT"] = os.environ["SYSTEMROOT"]
+    return env
+
+
+def redact_secrets(text: str) -> str:
+    """Mask server secrets that sandboxed code may have read and printed"""
+    if not text:
+        return text
+    secrets = {Config.GROQ_API_KEY}
+    secrets.update(
+        value for name, value in os.environ.items() if _SECRET_NAME.search(name)
+    )
+    for secret in sorted(filter(None, secrets), key=len, reverse=True):
+        if len(secret) >= 8:
+            text = text.replace(secret, "[REDACTED]")
+    return _SECRET_PATTERN.sub("[REDACTED]", text)
+
+
+# Runs inside the sandbox subprocess. Caps its own memory and CPU time,
+# executes the user's file under cProfile and tracemalloc, stops it via an
+# interval timer once the time budget is spent (so slow code still yields a
+# profile) and writes a JSON report. The limits are set here rather than in
+# a preexec_fn, which can deadlock when the server has other threads running.
+_HARNESS = r'''
+import cProfile, json, pstats, signal, sys, time, traceback, tracemalloc
+
+path, report_path, budget, top_n = sys.argv[1], sys.argv[2], float(sys.argv[3]), int(sys.argv[4])
+memory_limit, cpu_limit = int(sys.argv[5]), int(sys.argv[6])
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+if resource is not None:
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit))
+
+
+class _ProfileBudgetExceeded(BaseException):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise _ProfileBudgetExceeded()
+
+
+if hasattr(signal, "setitimer"):
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+with open(path) as f:
+    code_obj = compile(f.read(), path, "exec")
+
+report = {"error": "", "timed_out": False}
+profiler = cProfile.Profile()
+tracemalloc.start()
+if hasattr(signal, "setitimer"):
+    signal.setitimer(signal.ITIMER_REAL, budget)
+start = time.perf_counter()
+profiler.enable()
+try:
+    exec(code_obj, {"__name__": "__main__", "__file__": path})
+except _ProfileBudgetExceeded:
+    report["timed_out"] = True
+except SystemExit:
+    pass
+except BaseException:
+    report["error"] = traceback.format_exc(limit=5)
+finally:
+    profiler.disable()
+    report["wall_time"] = time.perf_counter() - start
+    if hasattr(signal, "setitimer"):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+report["peak_memory_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, path)])
+tracemalloc.stop()
+
+report["alloc_hotspots"] = [
+    {"line": stat.traceback[0].lineno, "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+    for stat in snapshot.statistics("lineno")
+    if stat.traceback[0].lineno > 0
+][:top_n]
+
+stats = pstats.Stats(profiler).stats
+functions = [
+    {"line": line, "function": name, "ncalls": nc, "tottime": round(tt, 4), "cumtime": round(ct, 4)}
+    for (filename, line, name), (cc, nc, tt, ct, callers) in stats.items()
+    if filename == path
+]
+functions.sort(key=lambda item: item["cumtime"], reverse=True)
+report["time_hotspots"] = functions[:top_n]
+
+with open(report_path, "w") as f:
+    json.dump(report, f)
+'''
+
+
+class SandboxProfiler:
+    """Profile code for time and allocations in a resource-limited subprocess.
+
+    The subprocess only has its memory and CPU time capped and runs without
+    the server's environment variables. It is NOT isolated from the
+    filesystem or the network: submitted code can read any file the server
+    user can (including ``.env``) and open connections. That is why
+    performance mode is off unless ``ENABLE_PERFORMANCE_MODE`` is set, and
+    should only be enabled for trusted users. At most
+    ``MAX_CONCURRENT_PROFILES`` runs execute at once across all requests.
+    """
+
+    def __init__(self, time_budget: float = None, memory_limit_mb: int = None):
+        self.time_budget = time_budget or Config.PROFILE_TIME_BUDGET
+        self.memory_limit_mb = memory_limit_mb or Config.PROFILE_MEMORY_LIMIT_MB
+        self.top_n = Config.PROFILE_TOP_N
+        self.chunk_processor = ChunkProcessor()
+        self._slots = threading.BoundedSemaphore(Config.MAX_CONCURRENT_PROFILES)
+
+    def profile(self, code: str, time_budget: float = None) -> dict:
+        """Run code under cProfile and tracemalloc and return the hotspot report.
+
+        Waits at most the time budget for a free sandbox slot. The report
+        is rebuilt from type-checked fields of the child's output, with
+        every string redacted.
+        """
+        time_budget = time_budget or self.time_budget
+        result = {
+            "success": False,
+            "error": "",
+            "timed_out": False,
+            "wall_time": None,
+            "peak_memory_kb": None,
+            "time_hotspots": [],
+            "alloc_hotspots": [],
+        }
+
+        if not self._slots.acquire(timeout=time_budget):
+            result["error"] = "The profiling sandbox is busy; try again shortly"
+            return result
+        try:
+            report, error = self._run_harness(code, time_budget)
+        finally:
+            self._slots.release()
+
+        if report is None:
+            result["error"] = redact_secrets(error)
+            result["timed_out"] = error == "Profiling timed out"
+            return result
+
+        result.update(self._validate_report(report))
+        result["success"] = (
+            not result["error"]
+            and not result["timed_out"]
+            and result["wall_time"] is not None
+        )
+        return result
+
+    def _run_harness(self, code: str, time_budget: float) -> tuple:
+        """(raw JSON report, "") of one sandbox run, or (None, error) without one"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            code_path = os.path.join(tmp_dir, "user_code.py")
+            harness_path = os.path.join(tmp_dir, "_profile_harness.py")
+            report_path = os.path.join(tmp_dir, "report.json")
+            with open(code_path, "w") as f:
+                f.write(code)
+            with open(harness_path, "w") as f:
+                f.write(_HARNESS)
+
+            try:
+                process = subprocess.run(
+                    [
+                        sys.executable,
+                        "-I",  # ignore PYTHON* variables and user site-packages
+                        harness_path,
+                        code_path,
+                        report_path,
+                        str(time_budget),
+                        str(self.top_n),
+                        str(self.memory_limit_mb * 1024 * 1024),
+                        str(int(time_budget) + 5),
+                    ],
+                    capture_output=True,
+                    text=True,
+                    cwd=tmp_dir,
+                    env=sandbox_env(),
+                    timeout=time_budget + 10,
+                )
+            except subprocess.TimeoutExpired:
+                return None, "Profiling timed out"
+            except Exception as e:
+                return None, f"Sandbox error: {e}"
+
+            try:
+                with open(report_path) as f:
+                    report = json.load(f)
+            except (OSError, ValueError):
+                report = None
+            if not isinstance(report, dict) or not report:
+                stderr = process.stderr.strip()[-MAX_PROFILE_ERROR_CHARS:]
+                return None, stderr or "Profiler produced no valid report"
+            return report, ""
+
+    def _validate_report(self, report: dict) -> dict:
+        """Rebuild the child's report from expected, type-checked fields.
+
+        The report file is written by the same process that ran the user's
+        code, so anything in it may have been forged; unknown keys are
+        dropped and strings are capped and redacted before they reach the
+        prompt, the UI or the JSON API.
+        """
+
+        def number(value, kind):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return None
+            if kind is int:
+                return int(value) if value >= 0 else None
+            return round(float(value), 4) if 0 <= value < float("inf") else None
+
+        def function_name(value):
+            if isinstance(value, str) and _FUNCTION_NAME.fullmatch(value):
+                return redact_secrets(value)
+            return "<unknown>"
+
+        def entries(value, fields):
+            spots = []
+            for item in value if isinstance(value, list) else []:
+                if not isinstance(item, dict):
+                    continue
+                spot = {
+                    name: (
+                        function_name(item.get(name))
+                        if kind is str
+                        else number(item.get(name), kind)
+                    )
+                    for name, kind in fields
+                }
+                if spot["line"] and None not in spot.values():
+                    spots.append(spot)
+            return spots[: self.top_n]
+
+        error = report.get("error")
+        return {
+            "error": redact_secrets(
+                error[:MAX_PROFILE_ERROR_CHARS] if isinstance(error, str) else ""
+            ),
+            "timed_out": report.get("timed_out") is True,
+            "wall_time": number(report.get("wall_time"), float),
+            "peak_memory_kb": number(report.get("peak_memory_kb"), int),
+            "time_hotspots": entries(
+                report.get("time_hotspots"),
+                (
+                    ("line", int),
+                    ("function", str),
+                    ("ncalls", int),
+                    ("tottime", float),
+                    ("cumtime", float),
+                ),
+            ),
+            "alloc_hotspots": entries(
+                report.get("alloc_hotspots"),
+                (("line", int), ("size_kb", float), ("count", int)),
+            ),
+        }
+
+    def summarize(self, code: str, profile: dict) -> str:
+        """Compact profile for the prompt, with source context for each hotspot"""
+        if not profile["time_hotspots"] and not profile["alloc_hotspots"]:
+            return ""
+
+        parts = []
+        status = "stopped at time budget" if profile["timed_out"] else "completed"
+        parts.append(
+            f"Run {status} after {profile['wall_time'] or 0:.3f}s, "
+            f"peak traced memory {profile['peak_memory_kb'] or 0} KB"
+        )
+
+        if profile["time_hotspots"]:
+            parts.append("")
+            parts.append("Top functions by cumulative time:")
+            for spot in profile["time_hotspots"]:
+                parts.append(
+                    f"- {spot['function']} (line {spot['line']}): "
+                    f"{spot['cumtime']:.4f}s cumulative, {spot['tottime']:.4f}s own, "
+                    f"{spot['ncalls']} calls"
+                )
+
+        if profile["alloc_hotspots"]:
+            parts.append("")
+            parts.append("Top lines by allocated memory:")
+            for spot in profile["alloc_hotspots"]:
+                parts.append(
+                    f"- line {spot['line']}: {spot['size_kb']} KB in {spot['count']} blocks"
+                )
+
+        source = SourceText(code)
+
+        # Show the source around the hottest function and allocation site;
+        # the module body always tops cumulative time so it is skipped
+        hot_lines = []
+        functions = [
+            spot for spot in profile["time_hotspots"] if spot["function"] != "<module>"
+        ]
+        if functions:
+            hot_lines.append(functions[0]["line"])
+        if profile["alloc_hotspots"]:
+            hot_lines.append(profile["alloc_hotspots"][0]["line"])
+        for line in dict.fromkeys(hot_lines):
+            parts.append("")
+            parts.append(f"Source around line {line}:")
+            parts.append(self.chunk_processor.get_error_context(source, line))
+
+        return "\n".join(parts)
+
+    def measure_speedup(
+        self, baseline: dict, code: str, time_budget: float = None
+    ) -> dict:
+        """Re-profile a candidate fix and compare against the baseline run"""
+        candidate = self.profile(code, time_budget)
+        candidate["speedup"] = None
+        if (
+            candidate["success"]
+            and baseline.get("wall_time")
+            and candidate["wall_time"]
+        ):
+            candidate["speedup"] = baseline["wall_time"] / candidate["wall_time"]
+        return candidate
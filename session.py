@@ -0,0 +1,228 @@
+import difflib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+
+# Earlier turns kept in the summary that replaces a compacted conversation
+SUMMARY_TURNS = 5
+
+
+def line_diff(old: str, new: str) -> str:
+    """Unified line diff from the previous submission to the new one"""
+    return "\n".join(
+        difflib.unified_diff(
+            old.split("\n"),
+            new.split("\n"),
+            "previous.py",
+            "current.py",
+            n=2,
+            lineterm="",
+        )
+    )
+
+
+def follow_up_prompt(diff: str, error: str, analysis: dict) -> str:
+    """Short follow-up turn: the code changes and the new error only"""
+    prompt_parts = []
+    if diff:
+        prompt_parts.append(
+            "I changed the code and ran it again. This is the line diff against the code I sent before:"
+        )
+        prompt_parts.append("```diff")
+        prompt_parts.append(diff)
+        prompt_parts.append("```")
+    else:
+        prompt_parts.append("I ran the same code again and got a different error.")
+    prompt_parts.append("")
+    prompt_parts.append("NEW ERROR MESSAGE:")
+    prompt_parts.append(error)
+    prompt_parts.append("")
+    prompt_parts.append(
+        "Analyze the NEW error in the UPDATED code. Reply in EXACTLY the same format as your previous answer, with three genuinely different solutions."
+    )
+    if analysis.get("output_mode") == "patch":
+        prompt_parts.append(
+            "Every unified diff must apply to the UPDATED code, not to the code in my first message."
+        )
+    return "\n".join(prompt_parts)
+
+
+class AnalysisSession:
+    """Conversation state for one user who edits and resubmits their code.
+
+    The first submission is sent as a full prompt. Later ones are appended
+    to the same conversation as a line diff plus the new traceback, so the
+    messages sent before them stay byte-identical and upstream prefix
+    caching applies. Once the conversation grows past
+    ``SESSION_COMPACT_TOKENS`` the next submission starts a new full prompt
+    with a short summary, and the conversation is replaced by that summary
+    when the turn succeeds. Callers hold ``lock`` for a whole turn.
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.lock = threading.Lock()
+        self.messages = []  # user/assistant turns after the system prompt
+        self.summary = ""
+        self.turns = []
+        self.last_code = None
+        self.last_output_mode = None
+        self.touched = time.monotonic()
+
+    def plan_turn(
+        self, code: str, error: str, analysis: dict, full_prompt: str, estimate_tokens
+    ) -> dict:
+        """Prompt and earlier messages for this submission.
+
+        ``estimate_tokens(text)`` is the backend's token estimate; it decides
+        when the conversation is compacted. The session is not changed, so a
+        failed call leaves the earlier conversation intact.
+        """
+        plan = {
+            "kind": "initial",
+            "prompt": full_prompt,
+            "messages": [],
+            "diff_lines": None,
+            "full_prompt_tokens": estimate_tokens(full_prompt),
+            "compact": False,
+        }
+        summary = self.summary
+        if self.messages:
+            diff = line_diff(self.last_code, code)
+            follow_up = follow_up_prompt(diff, error, analysis)
+            conversation_tokens = sum(
+                estimate_tokens(message["content"]) for message in self.messages
+            ) + estimate_tokens(follow_up)
+            if (
+                analysis.get("output_mode") != self.last_output_mode
+                or analysis.get("profile_summary")
+                or len(diff) > len(code) * Config.SESSION_MAX_DIFF_RATIO
+                or conversation_tokens > Config.SESSION_COMPACT_TOKENS
+            ):
+                # A diff would not save anything here; start over from a summary
+                plan["compact"] = True
+                summary = self._summarize()
+            else:
+                plan["kind"] = "follow-up"
+                plan["prompt"] = follow_up
+                plan["messages"] = list(self.messages)
+                plan["diff_lines"] = sum(
+                    1
+                    for line in diff.split("\n")
+                    if line[:1] in "+-" and not line.startswith(("+++", "---"))
+                )
+
+        if plan["kind"] == "initial" and summary:
+            plan["prompt"] = (
+                "EARLIER ATTEMPTS IN THIS SESSION (already fixed or superseded):\n"
+                f"{summary}\n\n{full_prompt}"
+            )
+        plan["sent_prompt_tokens"] = estimate_tokens(plan["prompt"])
+        return plan
+
+    def record(self, plan: dict, code: str, analysis: dict, run: dict) -> list:
+        """Append a finished turn; returns the per-turn metrics so far"""
+        if plan["compact"]:
+            self.compact()
+        self.messages.append({"role": "user", "content": plan["prompt"]})
+        self.messages.append({"role": "assistant", "content": run["raw_response"]})
+        self.last_code = code
+        self.last_output_mode = analysis.get("output_mode")
+
+        error_details = analysis["error_details"]
+        explanation = (run["sections"].get("explanation") or "").strip()
+        self.turns.append(
+            {
+                "turn": len(self.turns) + 1,
+                "kind": plan["kind"],
+                "diff_lines": plan["diff_lines"],
+                "sent_prompt_tokens": plan["sent_prompt_tokens"],
+                "full_prompt_tokens": plan["full_prompt_tokens"],
+                "prompt_tokens": run["prompt_tokens"],
+                "completion_tokens": run["completion_tokens"],
+                "latency": run["latency"],
+                "error": f"{error_details['error_type']}: {error_details['error_message']}",
+                "explanation": explanation.split("\n")[0][:300],
+            }
+        )
+        return [
+            {key: value for key, value in turn.items() if key != "explanation"}
+            for turn in self.turns
+        ]
+
+    def compact(self):
+        """Replace the conversation with a summary of its latest turns"""
+        if not self.messages:
+            return
+        self.summary = self._summarize()
+        self.messages = []
+        if Config.DEBUG_MODE:
+            print(
+                f"Debug: Compacted session {self.session_id} after {len(self.turns)} turns"
+            )
+
+    def _summarize(self) -> str:
+        """Summary of the latest turns that replaces a compacted conversation"""
+        lines = []
+        for turn in self.turns[-SUMMARY_TURNS:]:
+            lines.append(f"- Attempt {turn['turn']}: {turn['error']}")
+            if turn["explanation"]:
+                lines.append(f"  Cause: {turn['explanation']}")
+        return "\n".join(lines)
+
+
+class SessionStore:
+    """Bounded in-memory sessions; idle ones expire, least recently used go first.
+
+    Session ids are issued by the server (``create``) so that callers cannot
+    pick one that another user already holds; ``get`` only finds existing
+    sessions.
+    """
+
+    def __init__(self, max_sessions: int = None, ttl: float = None):
+        self.max_sessions = max_sessions or Config.MAX_SESSIONS
+        self.ttl = ttl or Config.SESSION_TTL_SECONDS
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def create(self, session_id=None):
+        """Open a session and return its id: a new random one, or
+        ``session_id`` (kept if it already exists)"""
+        session_id = session_id or secrets.token_urlsafe(16)
+        with self._lock:
+            self._expire()
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                session = AnalysisSession(session_id)
+            session.touched = time.monotonic()
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session_id
+
+    def get(self, session_id) -> AnalysisSession:
+        """Existing session for the id, or None if it is unknown or expired"""
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.touched = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def drop(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.touched >= cutoff:
+                break
+            self._sessions.popitem(last=False)